@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+from benchmark.driver import TrafficDriver
+from benchmark.fake_openai import Transcript
+from benchmark.local_backend import LocalBackend, createBenchmarkBackend
+
+parser = argparse.ArgumentParser(prog="python -m benchmark", description="Replay scripted transcripts through OpenAIServer without OpenAI or Discord")
+parser.add_argument("--backend", choices=("auto", "local", "cli", "api"), default="auto")
+parser.add_argument("--transcripts", default=os.path.join(os.path.dirname(__file__), "transcripts.json"))
+parser.add_argument("--requests", type=int, default=30)
+parser.add_argument("--concurrency", type=int, default=2)
+parser.add_argument("--users", type=int, default=2)
+parser.add_argument("--channels", type=int, default=2)
+parser.add_argument("--llm-latency", type=float, default=None)
+parser.add_argument("--discord-latency", type=float, default=0.0)
+parser.add_argument("--sequential-tools", action="store_true")
+parser.add_argument("--json", action="store_true")
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.WARNING)
+logging.disable(logging.INFO)
+
+backend = createBenchmarkBackend(args.backend)
+driver = TrafficDriver(
+    backend,
+    Transcript.load(args.transcripts),
+    requests=args.requests,
+    concurrency=args.concurrency,
+    users=args.users,
+    channels=args.channels,
+    llmLatency=args.llm_latency,
+    discordLatency=args.discord_latency,
+    sequentialTools=args.sequential_tools
+)
+try:
+    result = asyncio.run(driver.run())
+finally:
+    if isinstance(backend, LocalBackend):
+        backend.close()
+
+if args.json:
+    print(json.dumps(result, indent=2))
+else:
+    print(f"backend:              {result['backend']}")
+    print(f"requests:             {result['requests']} ({result['failures']} failed, {result['mismatches']} mismatched) in {result['elapsed']:.2f}s")
+    print(f"latency p50 / p99:    {result['p50'] * 1000:.1f} / {result['p99'] * 1000:.1f} ms")
+    print(f"turns/sec:            {result['turnsPerSecond']:.2f}")
+    print(f"exec calls/request:   {result['execPerRequest']:.2f} (mean {result['meanExec'] * 1000:.1f} ms)")
+    print(f"tool calls/request:   {result['toolsPerRequest']:.2f}")
+    print(f"completion latency:   {result['meanCompletion'] * 1000:.1f} ms")
+    print(f"container starts:     {result['containerStarts']} (mean {result['meanContainerStart'] * 1000:.1f} ms)")
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import math
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+from benchmark.fake_openai import FakeChatCompletions, Transcript
+from logic.docker_backend import DockerBackend
+from logic.openai_server import OpenAIServer
+from logic.session_manager import SessionManager
+from logic.tracing import tracer
+
+def percentile(values: list[float], q: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+class TrafficDriver:
+    def __init__(
+            self,
+            backend: DockerBackend,
+            transcripts: list[Transcript],
+            requests: int = 30,
+            concurrency: int = 2,
+            users: int = 2,
+            channels: int = 2,
+            llmLatency: float | None = None,
+            discordLatency: float = 0.0,
+            sequentialTools: bool = False
+        ):
+        self.backend = backend
+        self.transcripts = transcripts
+        self.requests = requests
+        self.users = users
+        self.channels = channels
+        self.discordLatency = discordLatency
+        self.sequentialTools = sequentialTools
+        self.fake = FakeChatCompletions(transcripts, latency=llmLatency)
+        self.sessions = SessionManager(self.createOpenAIServer, maxSessions=users * channels, maxConcurrency=concurrency)
+        self.logDir = tempfile.mkdtemp(prefix="openailinux-benchmark-logs-")
+        self.latencies: list[float] = []
+        self.failures = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def createOpenAIServer(self, key: str, userID: int) -> OpenAIServer:
+        openAI = OpenAIServer(
+            token="benchmark",
+            dockerBackend=self.backend,
+            serverID=f"benchmark-{key}",
+            sequentialTools=self.sequentialTools,
+            sessionKey=key,
+            ownerID=userID,
+            baseURL=self.fake.baseURL,
+            logDir=os.path.join(self.logDir, key)
+        )
+        if self.backend.name == "local":
+            openAI.server.provisionCommand = None
+            openAI.server.directoryIndex = None
+            openAI.server.workDir = openAI.server.homeDir = self.backend.root(openAI.server.name)
+        return openAI
+
+    async def onProgress(self, cmd: str, output: str):
+        if self.discordLatency > 0:
+            await asyncio.sleep(self.discordLatency)
+
+    async def message(self, index: int):
+        transcript = self.transcripts[index % len(self.transcripts)]
+        userID = index % self.users + 1
+        key = str(100000 + index % (self.users * self.channels))
+        started = perf_counter()
+        try:
+            async with self.sessions.acquire(userID, key) as openAI:
+                await openAI.process(transcript.prompt, onProgress=self.onProgress)
+        except Exception as e:
+            self.failures += 1
+            self.logger.error(f"Request {index} failed: {e}")
+            return
+        self.latencies.append(perf_counter() - started)
+
+    async def run(self) -> dict:
+        tracer.enabled = True
+        self.fake.start()
+        try:
+            started = perf_counter()
+            await asyncio.gather(*[self.message(i) for i in range(self.requests)])
+            elapsed = perf_counter() - started
+        finally:
+            await asyncio.to_thread(self.sessions.closeAll)
+            self.fake.stop()
+            shutil.rmtree(self.logDir, ignore_errors=True)
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        def spans(kind: str) -> tuple[int, float]:
+            histograms = [histogram for (spanKind, _), histogram in tracer.durations.items() if spanKind == kind]
+            return sum(histogram.count for histogram in histograms), sum(histogram.sum for histogram in histograms)
+        commands, commandTime = spans("command")
+        completions, completionTime = spans("completion")
+        tools, _ = spans("tool")
+        starts, startTime = spans("start")
+        completed = max(1, len(self.latencies))
+        return {
+            "backend": self.backend.name,
+            "requests": self.requests,
+            "failures": self.failures,
+            "mismatches": self.fake.mismatches,
+            "elapsed": elapsed,
+            "p50": percentile(self.latencies, 50),
+            "p99": percentile(self.latencies, 99),
+            "turnsPerSecond": self.fake.requests / elapsed if elapsed > 0 else 0.0,
+            "execPerRequest": commands / completed,
+            "toolsPerRequest": tools / completed,
+            "meanExec": commandTime / commands if commands > 0 else 0.0,
+            "meanCompletion": completionTime / completions if completions > 0 else 0.0,
+            "containerStarts": starts,
+            "meanContainerStart": startTime / starts if starts > 0 else 0.0
+        }
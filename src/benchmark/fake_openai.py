@@ -0,0 +1,120 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from uuid import uuid4
+
+class Transcript:
+    def __init__(self, prompt: str, turns: list[dict], latency: float = 0.0):
+        self.prompt = prompt
+        self.turns = turns
+        self.latency = latency
+
+    @classmethod
+    def load(cls, path: str) -> list["Transcript"]:
+        with open(path) as f:
+            return [cls(item["prompt"], item["turns"], item.get("latency", 0.0)) for item in json.load(f)]
+
+class FakeChatCompletions:
+    def __init__(self, transcripts: list[Transcript], model: str = "gpt-4-1106-preview", latency: float | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.transcripts = transcripts
+        self.model = model
+        self.latency = latency
+        self.requests = 0
+        self.mismatches = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.thread: threading.Thread | None = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    @property
+    def baseURL(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="FakeChatCompletions", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def find(self, messages: list[dict]) -> Transcript | None:
+        request = next((message.get("content") or "" for message in messages if message["role"] == "user"), "")
+        for transcript in self.transcripts:
+            if transcript.prompt in request:
+                return transcript
+        return None
+
+    def check(self, turn: dict, messages: list[dict]):
+        expected = turn.get("expect")
+        if expected is None:
+            return
+        last = max(index for index, message in enumerate(messages) if message["role"] == "assistant")
+        outputs = [message.get("content") or "" for message in messages[last + 1:] if message["role"] == "tool"]
+        if not any(expected in output for output in outputs):
+            with self.lock:
+                self.mismatches += 1
+            self.logger.error(f"Expected {expected!r} in tool output, got {outputs}")
+
+    def respond(self, body: dict) -> dict:
+        with self.lock:
+            self.requests += 1
+        messages = body["messages"]
+        transcript = self.find(messages)
+        step = sum(1 for message in messages if message["role"] == "assistant")
+        if transcript is not None and 0 < step <= len(transcript.turns):
+            self.check(transcript.turns[step - 1], messages)
+        if transcript is None or step >= len(transcript.turns):
+            calls = [{"name": "write_report", "arguments": {"description": "Finished the scripted transcript"}}]
+        else:
+            calls = transcript.turns[step]["tool_calls"]
+        latency = self.latency if self.latency is not None else (transcript.latency if transcript is not None else 0.0)
+        if latency > 0:
+            sleep(latency)
+        promptTokens = sum(len(message.get("content") or "") for message in messages) // 4
+        return {
+            "id": f"chatcmpl-{uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time()),
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "tool_calls",
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{
+                        "id": f"call_{uuid4().hex[:24]}",
+                        "type": "function",
+                        "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+                    } for call in calls]
+                }
+            }],
+            "usage": {"prompt_tokens": promptTokens, "completion_tokens": 20 * len(calls), "total_tokens": promptTokens + 20 * len(calls)}
+        }
+
+    def handler(self):
+        fake = self
+        class ChatCompletionsHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                data = json.dumps(fake.respond(body)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+        return ChatCompletionsHandler
@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Iterable
+
+from logic.docker_backend import DockerBackend, DockerCLIBackend, ProcessShellChannel, ShellChannel, createBackend
+
+class LocalBackend(DockerBackend):
+    # Stand-in for docker when no daemon is reachable: every "container" is a
+    # scratch directory and commands run as host subprocesses. It isolates
+    # nothing, so only replay transcripts that are safe to run on the host.
+    name = "local"
+
+    def __init__(self):
+        self.baseDir = tempfile.mkdtemp(prefix="openailinux-benchmark-")
+        self.containers: dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def isAvailable(self) -> bool:
+        return True
+
+    def root(self, name: str) -> str:
+        return os.path.join(self.baseDir, name.replace("/", "_"))
+
+    def runContainer(self, name: str, image: str, cpu: float, ram: str, swap: str) -> bool:
+        with self.lock:
+            if name in self.containers:
+                return False
+            os.makedirs(self.root(name))
+            self.containers[name] = self.root(name)
+        return True
+
+    def stopContainer(self, name: str) -> bool:
+        with self.lock:
+            root = self.containers.pop(name, None)
+        if root is None:
+            return False
+        shutil.rmtree(root, ignore_errors=True)
+        return True
+
+    def containerExists(self, name: str) -> bool:
+        return name in self.containers
+
+    def listContainers(self, prefix: str) -> list[str]:
+        return [name for name in self.containers if name.startswith(prefix)]
+
+    def renameContainer(self, name: str, newName: str) -> bool:
+        with self.lock:
+            if name not in self.containers or newName in self.containers:
+                return False
+            os.rename(self.containers.pop(name), self.root(newName))
+            self.containers[newName] = self.root(newName)
+        return True
+
+    def imageExists(self, image: str) -> bool:
+        return True
+
+    def environment(self, name: str) -> dict[str, str]:
+        return {**os.environ, "HOME": self.root(name)}
+
+    def execCommand(self, name: str, workDir: str, cmd: str, timeout: int) -> subprocess.CompletedProcess[str]:
+        cwd = workDir if os.path.isdir(workDir) else self.root(name)
+        return subprocess.run(["timeout", str(timeout), "bash", "-c", cmd], cwd=cwd, env=self.environment(name), capture_output=True, text=True)
+
+    def writeStream(self, name: str, cmd: str, chunks: Iterable[bytes], timeout: int) -> subprocess.CompletedProcess[str]:
+        proc = subprocess.Popen(["timeout", str(timeout), "bash", "-c", cmd], cwd=self.root(name), env=self.environment(name), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        stdout, stderr = proc.communicate()
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace"))
+
+    def openShell(self, name: str) -> ShellChannel:
+        return ProcessShellChannel(["bash", "--noprofile", "--norc"], cwd=self.root(name), env=self.environment(name))
+
+    def close(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+def dockerReachable() -> bool:
+    if not DockerCLIBackend().isAvailable():
+        return False
+    return subprocess.run(["docker", "info"], capture_output=True).returncode == 0
+
+def createBenchmarkBackend(name: str = "auto") -> DockerBackend:
+    if name == "local" or (name == "auto" and not dockerReachable()):
+        return LocalBackend()
+    return createBackend("cli" if name == "auto" else name)
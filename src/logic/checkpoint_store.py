@@ -0,0 +1,134 @@
+import logging
+import re
+import threading
+from time import time
+from uuid import uuid4
+
+from logic.docker_backend import DockerBackend
+
+class Checkpoint:
+    def __init__(self, id: int, owner: str, image: str, label: str, workDir: str, size: int):
+        self.id = id
+        self.owner = owner
+        self.image = image
+        self.label = label
+        self.workDir = workDir
+        self.size = size
+        self.createdAt = time()
+
+class CheckpointStore:
+    # Checkpoints are `docker commit` images of a container's filesystem.
+    # Each image stacks on the one its container was started from, so only
+    # the difference to that parent is counted against the storage budget.
+    def __init__(
+            self,
+            backend: DockerBackend,
+            repository: str = "openailinux-checkpoint",
+            maxBytes: int = 2 * 1024 ** 3,
+            maxPerContainer: int = 5
+        ):
+        self.backend = backend
+        self.repository = repository
+        self.maxBytes = maxBytes
+        self.maxPerContainer = maxPerContainer
+        self.checkpoints: list[Checkpoint] = []
+        self.nextIDs: dict[str, int] = {}
+        self.images: dict[str, str] = {}
+        self.baselines: dict[str, bool] = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    @staticmethod
+    def sanitize(value: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "-", value).lstrip(".-")
+
+    def baselineImage(self, image: str) -> str:
+        return f"{self.repository}:baseline-{self.sanitize(image)}"
+
+    def baseline(self, image: str) -> str | None:
+        if image not in self.baselines:
+            self.baselines[image] = self.backend.imageExists(self.baselineImage(image))
+        return self.baselineImage(image) if self.baselines[image] else None
+
+    def saveBaseline(self, name: str, image: str) -> bool:
+        if not self.backend.commitContainer(name, self.baselineImage(image)):
+            return False
+        self.baselines[image] = True
+        self.logger.info(f"Saved baseline of {image} from {name}")
+        return True
+
+    def use(self, name: str, image: str):
+        with self.lock:
+            self.images[name] = image
+
+    def totalBytes(self) -> int:
+        with self.lock:
+            return sum(checkpoint.size for checkpoint in self.checkpoints)
+
+    def list(self, name: str) -> list[Checkpoint]:
+        with self.lock:
+            return [checkpoint for checkpoint in self.checkpoints if checkpoint.owner == name]
+
+    def get(self, name: str, checkpointID: int) -> Checkpoint | None:
+        with self.lock:
+            for checkpoint in self.checkpoints:
+                if checkpoint.owner == name and checkpoint.id == checkpointID:
+                    return checkpoint
+        return None
+
+    def create(self, name: str, label: str, workDir: str) -> Checkpoint | None:
+        image = f"{self.repository}:{self.sanitize(name)}-{uuid4().hex[:12]}"
+        if not self.backend.commitContainer(name, image):
+            self.logger.error(f"Failed to checkpoint {name}")
+            return None
+        with self.lock:
+            parent = self.images.get(name)
+        size = self.backend.imageSize(image) or 0
+        parentSize = self.backend.imageSize(parent) if parent is not None else None
+        with self.lock:
+            checkpointID = self.nextIDs.get(name, 0) + 1
+            self.nextIDs[name] = checkpointID
+            checkpoint = Checkpoint(checkpointID, name, image, label, workDir, max(0, size - (parentSize or 0)))
+            self.checkpoints.append(checkpoint)
+        self.logger.info(f"Created checkpoint {checkpointID} of {name} ({checkpoint.size} bytes)")
+        self.collect()
+        return checkpoint
+
+    def victim(self) -> Checkpoint | None:
+        with self.lock:
+            inUse = set(self.images.values())
+            candidates = [checkpoint for checkpoint in self.checkpoints if checkpoint.image not in inUse]
+            counts: dict[str, int] = {}
+            for checkpoint in self.checkpoints:
+                counts[checkpoint.owner] = counts.get(checkpoint.owner, 0) + 1
+            for checkpoint in candidates:
+                if counts[checkpoint.owner] > self.maxPerContainer:
+                    return checkpoint
+            if sum(checkpoint.size for checkpoint in self.checkpoints) > self.maxBytes and len(candidates) > 0:
+                return candidates[0]
+        return None
+
+    def collect(self):
+        skipped: list[Checkpoint] = []
+        while (checkpoint := self.victim()) is not None:
+            with self.lock:
+                self.checkpoints.remove(checkpoint)
+            if self.backend.removeImage(checkpoint.image):
+                self.logger.info(f"Removed checkpoint {checkpoint.id} of {checkpoint.owner}")
+            else:
+                skipped.append(checkpoint)
+                break
+        with self.lock:
+            self.checkpoints = skipped + self.checkpoints
+
+    def prune(self) -> int:
+        with self.lock:
+            known = {checkpoint.image for checkpoint in self.checkpoints} | set(self.images.values())
+        removed = 0
+        for image in self.backend.listImages(self.repository):
+            if image.startswith(f"{self.repository}:baseline-") or image in known:
+                continue
+            if self.backend.removeImage(image):
+                removed += 1
+        return removed
@@ -0,0 +1,97 @@
+import logging
+import shlex
+import subprocess
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Hashable
+
+CACHEABLE_COMMANDS = {
+    "test", "[", "ls", "cat", "head", "grep", "wc", "stat",
+    "pwd", "uname", "whoami", "id", "which", "nproc", "df", "du"
+}
+
+def isReadOnly(cmd: str, commands: set[str] = CACHEABLE_COMMANDS) -> bool:
+    if "$" in cmd or "`" in cmd or "\n" in cmd:
+        return False
+    lexer = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        return False
+    if len(tokens) == 0:
+        return False
+    expectCommand = True
+    for token in tokens:
+        if token == "|":
+            if expectCommand:
+                return False
+            expectCommand = True
+        elif all(char in lexer.punctuation_chars for char in token):
+            return False
+        elif expectCommand:
+            if token not in commands:
+                return False
+            expectCommand = False
+    return not expectCommand
+
+class CommandCache:
+    def __init__(self, maxEntries: int = 256, ttl: float = 30, maxOutputChars: int = 65536, commands: set[str] = CACHEABLE_COMMANDS):
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self.maxOutputChars = maxOutputChars
+        self.commands = commands
+        self.entries: OrderedDict[Hashable, tuple[float, subprocess.CompletedProcess[str]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def isCacheable(self, cmd: str) -> bool:
+        return isReadOnly(cmd, self.commands)
+
+    def get(self, key: Hashable) -> subprocess.CompletedProcess[str] | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, proc: subprocess.CompletedProcess[str]):
+        if len(proc.stdout) + len(proc.stderr) > self.maxOutputChars:
+            return
+        with self.lock:
+            self.entries[key] = (monotonic() + self.ttl, proc)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def bypass(self):
+        with self.lock:
+            self.bypassed += 1
+        self.invalidate()
+
+    def invalidate(self):
+        with self.lock:
+            if len(self.entries) > 0:
+                self.invalidations += 1
+                self.entries.clear()
+
+    def metrics(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "invalidations": self.invalidations
+            }
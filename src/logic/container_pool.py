@@ -0,0 +1,115 @@
+import logging
+import threading
+from collections import deque
+from uuid import uuid4
+
+from logic.docker_backend import DockerBackend
+
+PROVISION_COMMAND = "command -v ip > /dev/null || (apt update && apt install -y iproute2)"
+
+class ContainerPool:
+    def __init__(
+            self,
+            backend: DockerBackend,
+            image: str = "openai-sandbox",
+            fallbackImage: str = "ubuntu",
+            size: int = 1,
+            cpu: float = 1.0,
+            ram: str = "512mb",
+            swap: str = "512mb",
+            prefix: str = "openai-pool"
+        ):
+        self.backend = backend
+        self.image = image
+        self.fallbackImage = fallbackImage
+        self.size = size
+        self.cpu = cpu
+        self.ram = ram
+        self.swap = swap
+        self.prefix = prefix
+        self.resolvedImage: str | None = None
+        self.ready: deque[str] = deque()
+        self.warming = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def resolveImage(self) -> str:
+        if self.resolvedImage is not None:
+            return self.resolvedImage
+        if self.backend.imageExists(self.image):
+            self.resolvedImage = self.image
+        else:
+            self.logger.warning(f"Image {self.image} not found, falling back to {self.fallbackImage}")
+            self.resolvedImage = self.fallbackImage
+        return self.resolvedImage
+
+    def fill(self):
+        with self.lock:
+            if self.closed:
+                return
+            missing = self.size - len(self.ready) - self.warming
+            if missing <= 0:
+                return
+            self.warming += missing
+        for _ in range(missing):
+            threading.Thread(target=self.warm, daemon=True).start()
+
+    def adopt(self) -> int:
+        try:
+            names = self.backend.listContainers(f"{self.prefix}-")
+        except Exception as e:
+            self.logger.warning(f"Failed to list pooled containers: {e}")
+            return 0
+        with self.lock:
+            names = [name for name in names if name not in self.ready][:max(0, self.size - len(self.ready) - self.warming)]
+            self.warming += len(names)
+        for name in names:
+            threading.Thread(target=self.warm, args=(name, True), daemon=True).start()
+        return len(names)
+
+    def warm(self, name: str | None = None, adopted: bool = False):
+        name = name or f"{self.prefix}-{uuid4().hex[:12]}"
+        try:
+            if not adopted and not self.backend.runContainer(name, self.resolveImage(), self.cpu, self.ram, self.swap):
+                self.logger.error(f"Failed to start pooled container {name}")
+                return
+            proc = self.backend.execCommand(name, "/root", PROVISION_COMMAND, 600)
+            if proc.returncode != 0:
+                self.logger.error(f"Failed to provision pooled container {name}: {proc.stderr}")
+                self.backend.stopContainer(name)
+                return
+            with self.lock:
+                if not self.closed:
+                    self.ready.append(name)
+                    self.logger.info(f"Container {name} is ready ({len(self.ready)}/{self.size})")
+                    return
+            self.backend.stopContainer(name)
+        finally:
+            with self.lock:
+                self.warming -= 1
+
+    def acquire(self, name: str, cpu: float, ram: str, swap: str) -> bool:
+        if (cpu, ram, swap) != (self.cpu, self.ram, self.swap):
+            return False
+        while True:
+            with self.lock:
+                if len(self.ready) == 0:
+                    break
+                pooled = self.ready.popleft()
+            if self.backend.renameContainer(pooled, name):
+                self.logger.info(f"Assigned pooled container {pooled} to {name}")
+                self.fill()
+                return True
+            self.backend.stopContainer(pooled)
+        self.fill()
+        return False
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            names = list(self.ready)
+            self.ready.clear()
+        for name in names:
+            self.backend.stopContainer(name)
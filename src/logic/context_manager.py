@@ -0,0 +1,80 @@
+import json
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+class TokenCounter:
+    def __init__(self, model: str):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def countMessage(self, message: dict) -> int:
+        tokens = 4 + self.count(message.get("content") or "")
+        for toolCall in message.get("tool_calls") or []:
+            tokens += self.count(toolCall["function"]["name"]) + self.count(toolCall["function"]["arguments"])
+        return tokens
+
+class ConversationContext:
+    def __init__(self, counter: TokenCounter, budget: int = 12000, keepRecent: int = 6, summaryChars: int = 200):
+        self.counter = counter
+        self.budget = budget
+        self.keepRecent = keepRecent
+        self.summaryChars = summaryChars
+        self.messages: list[dict] = []
+        self.tokens: list[int] = []
+        self.compacted: set[int] = set()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def append(self, message: dict):
+        self.messages.append(message)
+        self.tokens.append(self.counter.countMessage(message))
+
+    def total(self) -> int:
+        return sum(self.tokens)
+
+    def summarize(self, message: dict) -> str:
+        content = message.get("content") or ""
+        try:
+            result = json.loads(content)
+        except ValueError:
+            result = None
+        if isinstance(result, dict) and "output" in result:
+            output = str(result["output"])
+            summary = output[-self.summaryChars:] if len(output) > self.summaryChars else output
+            return json.dumps({**result, "output": summary, "compacted": True})
+        return json.dumps({"compacted": True, "summary": content[:self.summaryChars]})
+
+    def compact(self):
+        total = self.total()
+        if total <= self.budget:
+            return
+        before = total
+        for index in range(2, max(2, len(self.messages) - self.keepRecent)):
+            if total <= self.budget:
+                break
+            message = self.messages[index]
+            if index in self.compacted or message["role"] not in ("tool", "assistant") or len(message.get("content") or "") <= self.summaryChars:
+                continue
+            if message["role"] == "tool":
+                message["content"] = self.summarize(message)
+            elif message.get("content"):
+                message["content"] = message["content"][:self.summaryChars]
+            self.compacted.add(index)
+            tokens = self.counter.countMessage(message)
+            total += tokens - self.tokens[index]
+            self.tokens[index] = tokens
+        if total != before:
+            self.logger.info(f"Compacted conversation from {before} to {total} tokens")
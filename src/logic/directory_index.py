@@ -0,0 +1,152 @@
+import logging
+import posixpath
+import shlex
+import threading
+from contextlib import contextmanager
+
+from logic.docker_backend import DockerBackend, ShellChannel
+
+WATCH_SCRIPT = """
+roots=""
+for root in {roots}; do [ -d "$root" ] && roots="$roots $root"; done
+if [ -z "$roots" ] || ! command -v inotifywait > /dev/null; then echo "= unavailable"; exit; fi
+log=$(mktemp)
+inotifywait -m -r -e create,delete,moved_to,moved_from --format "%e %w%f" $roots 2> "$log" &
+until grep -q "Watches established" "$log"; do kill -0 $! 2> /dev/null || {{ echo "= unavailable"; exit; }}; sleep 0.05; done
+find $roots -xdev -type d -printf "+ %p\\n" 2> /dev/null
+echo "= ready"
+wait
+"""
+
+SYNC_PREFIX = "/tmp/.openailinux-index-sync-"
+
+class DirectoryIndex:
+    # Events arrive asynchronously, so a hit is only trusted once every
+    # mutating command has been followed by a sentinel directory that came
+    # back through the stream. Commands create their own sentinel when they
+    # finish; a lost one is recovered by a sentinel covering all of them.
+    def __init__(self, backend: DockerBackend, roots: tuple[str, ...] = ("/root", "/home", "/tmp", "/opt", "/srv", "/mnt"), maxEntries: int = 200000):
+        self.backend = backend
+        self.roots = roots
+        self.maxEntries = maxEntries
+        self.directories: set[str] = set()
+        self.ready = False
+        self.sequence = 0
+        self.outstanding: set[int] = set()
+        self.mutating = 0
+        self.hits = 0
+        self.misses = 0
+        self.channel: ShellChannel | None = None
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def start(self, name: str):
+        self.stop()
+        try:
+            channel = self.backend.openShell(name)
+            channel.write(WATCH_SCRIPT.format(roots=" ".join(shlex.quote(root) for root in self.roots)).encode() + b"exit\n")
+        except Exception as e:
+            self.logger.warning(f"Failed to start directory index for {name}: {e}")
+            return
+        self.channel = channel
+        self.thread = threading.Thread(target=self.follow, args=(channel,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        channel, self.channel = self.channel, None
+        if channel is not None:
+            channel.close()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+        with self.lock:
+            self.directories.clear()
+            self.ready = False
+            self.outstanding.clear()
+
+    @staticmethod
+    def sentinel(name: str) -> str:
+        path = f"{SYNC_PREFIX}{name}"
+        return f"{{ mkdir {path} && rmdir {path}; }} 2> /dev/null"
+
+    @contextmanager
+    def mutation(self):
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+            self.outstanding.add(sequence)
+            self.mutating += 1
+        try:
+            yield self.sentinel(str(sequence))
+        finally:
+            with self.lock:
+                self.mutating -= 1
+
+    def syncCommand(self) -> str:
+        with self.lock:
+            if not self.ready or self.mutating > 0 or len(self.outstanding) == 0:
+                return ""
+            sequence = self.sequence
+        return self.sentinel(f"all-{sequence}") + "; "
+
+    def follow(self, channel: ShellChannel):
+        pending = b""
+        try:
+            while self.channel is channel:
+                for stream, data in channel.read(1):
+                    if stream != 1:
+                        continue
+                    if data == b"":
+                        return
+                    lines = (pending + data).split(b"\n")
+                    pending = lines.pop()
+                    for line in lines:
+                        self.apply(line.decode(errors="replace"))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Directory index stream failed: {e}")
+        finally:
+            with self.lock:
+                self.ready = False
+
+    def apply(self, line: str):
+        kind, _, path = line.partition(" ")
+        with self.lock:
+            if kind == "=":
+                self.ready = path == "ready"
+                if self.ready:
+                    self.logger.info(f"Indexed {len(self.directories)} directories")
+                return
+            if "Q_OVERFLOW" in kind.split(","):
+                self.logger.warning("Directory index overflowed, falling back to test -d")
+                self.directories.clear()
+                self.ready = False
+                return
+            if kind != "+" and "ISDIR" not in kind.split(","):
+                return
+            path = posixpath.normpath(path)
+            if path.startswith(SYNC_PREFIX):
+                if kind.startswith("CREATE"):
+                    self.synced(path[len(SYNC_PREFIX):])
+                return
+            if kind == "+" or kind.startswith(("CREATE", "MOVED_TO")):
+                if len(self.directories) < self.maxEntries:
+                    self.directories.add(path)
+            elif kind.startswith(("DELETE", "MOVED_FROM")):
+                prefix = path + "/"
+                self.directories = {directory for directory in self.directories if directory != path and not directory.startswith(prefix)}
+
+    def synced(self, name: str):
+        if name.isdigit():
+            self.outstanding.discard(int(name))
+        elif name.startswith("all-") and name[4:].isdigit():
+            self.outstanding = {sequence for sequence in self.outstanding if sequence > int(name[4:])}
+
+    def contains(self, path: str) -> bool:
+        with self.lock:
+            if self.ready and len(self.outstanding) == 0 and path in self.directories:
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
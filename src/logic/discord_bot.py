@@ -1,89 +1,341 @@
-from time import sleep
+import asyncio
 import discord
+import importlib
 import logging
 
+from logic.checkpoint_store import CheckpointStore
+from logic.command_cache import CommandCache
+from logic.container_pool import ContainerPool
+from logic.docker_backend import createBackend
+from logic.job_scheduler import Job, JobScheduler
+from logic.message_updater import MessageUpdater
 from logic.openai_server import OpenAIServer
+from logic.port_forwarder import PortForwarder
+from logic.resource_monitor import HostSaturatedError, ResourceMonitor
+from logic.session_manager import SessionManager
+from logic.startup_timer import StartupTimer
+from logic.tracing import tracer
 
 class DiscordBot:
-    def __init__(self, token: str, userID: int, openAIToken: str):
-        self.userID = userID
+    def __init__(
+            self,
+            token: str,
+            userIDs: list[int],
+            openAIToken: str,
+            dockerBackend: str = "cli",
+            poolSize: int = 1,
+            sandboxImage: str = "openai-sandbox",
+            cpu: float = 1.0,
+            ram: str = "512mb",
+            swap: str = "512mb",
+            maxSessions: int = 4,
+            maxConcurrency: int = 2,
+            sequentialTools: bool = False,
+            commandCache: bool = False,
+            jobsPath: str = "jobs.db",
+            checkpointBudget: int = 2 * 1024 ** 3,
+            resourceInterval: float = 10.0,
+            maxCPU: float | None = None,
+            maxRAM: str | None = None,
+            admissionTimeout: float = 300,
+            idleTimeout: float | None = None,
+            editInterval: float = 1.0,
+            maxParallelDownloads: int = 4,
+            maxAttachmentBytes: int = 100 * 1024 ** 2,
+            maxTotalAttachmentBytes: int = 500 * 1024 ** 2,
+            startupTimer: StartupTimer | None = None
+        ):
+        self.userIDs = set(userIDs)
         self.token = token
+        self.openAIToken = openAIToken
         self.client = discord.Client(intents=discord.Intents.all())
         self.isReady = False
-        self.openAI = OpenAIServer(token=openAIToken)
+        self.startupTimer = startupTimer or StartupTimer()
+        self.bootTask: asyncio.Task | None = None
+        self.dockerAvailable: bool | None = None
+        self.updater = MessageUpdater(self.editEmbed, interval=editInterval)
+        self.maxParallelDownloads = maxParallelDownloads
+        self.maxAttachmentBytes = maxAttachmentBytes
+        self.maxTotalAttachmentBytes = maxTotalAttachmentBytes
+        self.backend = createBackend(dockerBackend)
+        self.pool = ContainerPool(self.backend, image=sandboxImage, size=poolSize, cpu=cpu, ram=ram, swap=swap)
+        self.forwarder = PortForwarder()
+        self.checkpoints = CheckpointStore(self.backend, maxBytes=checkpointBudget) if checkpointBudget > 0 else None
+        self.monitor = ResourceMonitor(self.backend, interval=resourceInterval, maxCPU=maxCPU, maxRAM=maxRAM) if resourceInterval > 0 else None
+        self.cpu = cpu
+        self.ram = ram
+        self.swap = swap
+        self.sequentialTools = sequentialTools
+        self.commandCache = commandCache
+        self.scheduler = JobScheduler(self.handleScheduledJobs, path=jobsPath)
+        self.sessions = SessionManager(
+            self.createOpenAIServer,
+            maxSessions=maxSessions,
+            maxConcurrency=maxConcurrency,
+            idleTimeout=idleTimeout,
+            monitor=self.monitor,
+            admissionTimeout=admissionTimeout,
+            scheduler=self.scheduler
+        )
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.level = logging.INFO
 
+    def createOpenAIServer(self, key: str, userID: int) -> OpenAIServer:
+        return OpenAIServer(
+            token=self.openAIToken,
+            dockerBackend=self.backend,
+            pool=self.pool,
+            cpu=self.cpu,
+            ram=self.ram,
+            swap=self.swap,
+            serverID=f"openai-{key}",
+            sequentialTools=self.sequentialTools,
+            scheduler=self.scheduler,
+            sessionKey=key,
+            ownerID=userID,
+            forwarder=self.forwarder,
+            commandCache=CommandCache() if self.commandCache else None,
+            checkpoints=self.checkpoints,
+            monitor=self.monitor
+        )
+
     def run(self):
         try:
             @self.client.event
             async def on_ready():
                 if self.isReady:
                     return
-                logging.info("Discord bot is Ready")
-                if self.openAI.server.isRunning():
-                    self.openAI.server.stop()
-                self.openAI.server.start()
+                self.startupTimer.phase("Connected to Discord")
+                self.scheduler.start()
                 self.isReady = True
-                try:
-                    user = await self.client.fetch_user(self.userID)
-                    await user.send("Botが起動しました")
-                except:
-                    self.logger.error("Failed to send message to user")
+                self.bootTask = asyncio.create_task(self.boot())
+                for userID in self.userIDs:
+                    try:
+                        user = await self.client.fetch_user(userID)
+                        await user.send("Botが起動しました")
+                    except:
+                        self.logger.error(f"Failed to send message to user {userID}")
 
             @self.client.event
             async def on_message(message: discord.Message):
-                try:
-                    replyMessage = None
-                    if message.author.bot or message.guild != None:
-                        return
-                    if message.author.id != self.userID:
-                        return
-                    while self.openAI.runningLock:
-                        sleep(5)
+                if message.author.bot or message.guild != None:
+                    return
+                if message.author.id not in self.userIDs:
+                    return
+                if not await self.checkDocker():
                     embed = discord.Embed()
-                    attachmentPath = None
-
-                    if len(message.attachments) > 0:
-                        embed.title = "ファイルをダウンロード中"
-                        embed.color = discord.Color.blue()
-                        embed.add_field(name="完了", value=str(0))
-                        embed.add_field(name="ファイル数", value=str(len(message.attachments)))
-
-                        replyMessage = await message.reply(embed=embed)
-                        attachmentPath = f"/tmp/{message.id}"
-                        self.openAI.server.runCommand(f"mkdir -p {attachmentPath}")
-                        for i in range(len(message.attachments)):
-                            attachment = message.attachments[i]
-                            rawData = await attachment.read()
-                            self.openAI.server.writeRawFile(f"{attachmentPath}/{attachment.filename}", rawData)
-                            embed.set_field_at(0, name="完了", value=str(i+1))
-                            await replyMessage.edit(embed=embed)
-
-                    embed.clear_fields()
-                    embed.title = "実行中"
-                    embed.color = discord.Color.blue()
-                    if replyMessage is None:
-                        replyMessage = await message.reply(embed=embed)
+                    self.setErrorEmbed(embed, RuntimeError("Docker is not available on the host, so no container can be started"))
+                    await message.reply(embed=embed)
+                    return
+                replyMessage = None
+                if str(message.channel.id) not in self.sessions:
+                    replyMessage = await message.reply(embed=discord.Embed(title="コンテナを準備中", color=discord.Color.blue()))
+                try:
+                    async with self.sessions.acquire(message.author.id, str(message.channel.id)) as openAI:
+                        await self.handleMessage(message, openAI, replyMessage)
+                except Exception as e:
+                    if isinstance(e, HostSaturatedError):
+                        self.logger.warning(e)
                     else:
-                        await replyMessage.edit(embed=embed)
+                        self.logger.error(f"Failed to prepare container: {e}")
+                    embed = discord.Embed()
+                    self.setErrorEmbed(embed, e)
+                    await self.finishEmbed(message, replyMessage, embed)
+            
+            self.client.run(token=self.token, log_handler=None)
+        finally:
+            self.sessions.closeAll()
+            self.scheduler.close()
+            if self.pool is not None:
+                self.pool.close()
+            self.forwarder.shutdown()
+            if self.monitor is not None:
+                self.monitor.stop()
 
-                    await self.openAI.run(message.content, attachmentPath=attachmentPath)
+    async def checkDocker(self) -> bool:
+        if self.dockerAvailable is False:
+            if not await asyncio.to_thread(self.backend.isAvailable):
+                return False
+            self.logger.info("Docker became available")
+            self.dockerAvailable = True
+            self.bootTask = asyncio.create_task(self.boot())
+        return True
 
-                    embed.title = "実行完了"
-                    embed.color = discord.Color.green()
-                    embed.add_field(name="開放中のポート", value=(", ".join([str(port) for port in self.openAI.server.ports]) if len(self.openAI.server.ports) > 0 else "なし"))
-                    if len(self.openAI.reports) > 0:
-                        embed.add_field(name="レポート", value=self.openAI.reports[-1])
-                    await replyMessage.edit(embed=embed)
-                    
-                except Exception as e:
-                    self.logger.error(e)
-                    embed.title = "エラー"
-                    embed.description = "```\n"+str(e)+"\n```"
-                    embed.color = discord.Color.red()
-                    await replyMessage.edit(embed=embed)
+    async def boot(self):
+        self.dockerAvailable = await asyncio.to_thread(self.backend.isAvailable)
+        if not self.dockerAvailable:
+            self.logger.error("Docker is not available")
+            return
+        self.startupTimer.phase("Checked docker")
+        if self.monitor is not None:
+            self.monitor.start()
+        if self.pool is not None:
+            adopted = await asyncio.to_thread(self.pool.adopt)
+            await asyncio.to_thread(self.pool.fill)
+            self.startupTimer.phase(f"Adopted {adopted} pooled containers and started warming the pool")
+        if self.checkpoints is not None:
+            pruned = await asyncio.to_thread(self.checkpoints.prune)
+            self.startupTimer.phase(f"Pruned {pruned} stale checkpoints")
+        await asyncio.to_thread(importlib.import_module, "openai")
+        self.startupTimer.phase("Loaded OpenAI client")
+
+    async def handleMessage(self, message: discord.Message, openAI: OpenAIServer, replyMessage: discord.Message | None = None):
+        try:
+            embed = discord.Embed()
+            attachmentPath = None
+
+            if len(message.attachments) > 0:
+                embed.title = "ファイルをダウンロード中"
+                embed.color = discord.Color.blue()
+                embed.add_field(name="完了", value=str(0))
+                embed.add_field(name="ファイル数", value=str(len(message.attachments)))
+                embed.add_field(name="転送量", value=self.formatTransfer(0, sum(attachment.size for attachment in message.attachments)))
+
+                if replyMessage is None:
+                    replyMessage = await message.reply(embed=embed)
+                else:
+                    self.showEmbed(replyMessage, embed)
+                self.checkAttachments(message.attachments)
+                attachmentPath = f"/tmp/{message.id}"
+                await self.uploadAttachments(message.attachments, attachmentPath, openAI, replyMessage, embed)
+
+            embed.clear_fields()
+            embed.title = "実行中"
+            embed.color = discord.Color.blue()
+            if replyMessage is None:
+                replyMessage = await message.reply(embed=embed)
+            else:
+                self.showEmbed(replyMessage, embed)
+
+            await openAI.process(message.content, attachmentPath=attachmentPath, onProgress=self.progressReporter(replyMessage, embed))
+
+            self.setCompletedEmbed(embed, openAI)
+            await self.finishEmbed(message, replyMessage, embed)
             
-            self.client.run(token=self.token)
+        except Exception as e:
+            self.logger.error(e)
+            self.setErrorEmbed(embed, e)
+            await self.finishEmbed(message, replyMessage, embed)
+
+    def checkAttachments(self, attachments: list[discord.Attachment]):
+        for attachment in attachments:
+            if attachment.size > self.maxAttachmentBytes:
+                raise RuntimeError(f"{attachment.filename} is larger than {self.formatBytes(self.maxAttachmentBytes)}")
+        if sum(attachment.size for attachment in attachments) > self.maxTotalAttachmentBytes:
+            raise RuntimeError(f"Attachments are larger than {self.formatBytes(self.maxTotalAttachmentBytes)} in total")
+
+    async def uploadAttachments(self, attachments: list[discord.Attachment], attachmentPath: str, openAI: OpenAIServer, replyMessage: discord.Message, embed: discord.Embed, interval: float = 3.0):
+        total = sum(attachment.size for attachment in attachments)
+        sent = [0] * len(attachments)
+        completed = 0
+        semaphore = asyncio.Semaphore(self.maxParallelDownloads)
+
+        def refresh():
+            embed.set_field_at(0, name="完了", value=str(completed))
+            embed.set_field_at(2, name="転送量", value=self.formatTransfer(sum(sent), total))
+            self.showEmbed(replyMessage, embed)
+
+        async def upload(index: int, attachment: discord.Attachment):
+            nonlocal completed
+            def onSent(count: int):
+                sent[index] = count
+            async with semaphore:
+                async with tracer.span("upload", size=attachment.size):
+                    rawData = await attachment.read()
+                    if not await asyncio.to_thread(openAI.server.writeRawFile, f"{attachmentPath}/{attachment.filename}", rawData, "create", onSent):
+                        raise RuntimeError(f"Failed to upload {attachment.filename}")
+            completed += 1
+            refresh()
+
+        async def report():
+            while True:
+                await asyncio.sleep(interval)
+                refresh()
+
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(*[upload(i, attachment) for i, attachment in enumerate(attachments)])
         finally:
-            self.openAI.server.stop()
+            reporter.cancel()
+
+    @staticmethod
+    def formatTransfer(sent: int, total: int) -> str:
+        return f"{sent / 1024 / 1024:.1f} / {total / 1024 / 1024:.1f} MB"
+
+    async def editEmbed(self, message: discord.Message, embed: discord.Embed):
+        async with tracer.span("discord", "edit"):
+            await message.edit(embed=embed)
+
+    def showEmbed(self, message: discord.Message, embed: discord.Embed):
+        self.updater.update(message, embed.copy())
+
+    async def finishEmbed(self, message: discord.Message, replyMessage: discord.Message | None, embed: discord.Embed):
+        if replyMessage is None:
+            await message.reply(embed=embed)
+        else:
+            await self.updater.commit(replyMessage, embed.copy())
+
+    async def handleScheduledJobs(self, sessionKey: str, userID: int, jobs: list[Job]):
+        channel = self.client.get_channel(int(sessionKey)) or await self.client.fetch_channel(int(sessionKey))
+        prompt = "\n".join(f"- {job.message}" if job.message != "" else "- (no message)" for job in jobs)
+        async with self.sessions.acquire(userID, sessionKey) as openAI:
+            embed = discord.Embed(title="予約実行中", color=discord.Color.blue())
+            replyMessage = await channel.send(embed=embed)
+            try:
+                await openAI.process(prompt, isScheduled=True, onProgress=self.progressReporter(replyMessage, embed))
+                self.setCompletedEmbed(embed, openAI)
+            except Exception as e:
+                self.logger.error(e)
+                self.setErrorEmbed(embed, e)
+            await self.updater.commit(replyMessage, embed.copy())
+
+    def progressReporter(self, replyMessage: discord.Message, embed: discord.Embed):
+        async def onProgress(cmd: str, output: str):
+            output = output.replace("```", "`\u200b``")
+            embed.description = f"`{cmd[:200]}`\n```\n{output}\n```"
+            self.showEmbed(replyMessage, embed)
+        return onProgress
+
+    @staticmethod
+    def setCompletedEmbed(embed: discord.Embed, openAI: OpenAIServer):
+        embed.title = "実行完了"
+        embed.description = None
+        embed.color = discord.Color.green()
+        embed.add_field(name="開放中のポート", value=DiscordBot.formatPorts(openAI))
+        if openAI.server.commandCache is not None:
+            metrics = openAI.server.commandCache.metrics()
+            embed.add_field(name="コマンドキャッシュ", value=f"ヒット {metrics['hits']} / ミス {metrics['misses']} / 対象外 {metrics['bypassed']}")
+        if openAI.server.monitor is not None and (stats := openAI.server.monitor.latest(openAI.server.name)) is not None:
+            embed.add_field(name="リソース", value=f"CPU {stats.cpuPercent:.0f}% ({openAI.server.cpu} コア) / メモリ {DiscordBot.formatBytes(stats.memoryBytes)} / {openAI.server.ram.upper()}")
+        if openAI.server.checkpoints is not None:
+            checkpoints = openAI.server.checkpoints.list(openAI.server.name)
+            if len(checkpoints) > 0:
+                embed.add_field(name="チェックポイント", value=f"{len(checkpoints)} 件 (最新 #{checkpoints[-1].id}, 合計 {DiscordBot.formatBytes(openAI.server.checkpoints.totalBytes())})")
+        if openAI.reports.latest() is not None:
+            embed.add_field(name="レポート", value=openAI.reports.latest())
+
+    @staticmethod
+    def formatPorts(openAI: OpenAIServer) -> str:
+        if len(openAI.server.ports) == 0:
+            return "なし"
+        lines = []
+        for port, stats in openAI.server.portStats().items():
+            lines.append(
+                f"{port} → {openAI.server.ports[port]} "
+                f"(接続 {stats.connections}, 接続中 {stats.active}, 受信 {DiscordBot.formatBytes(stats.bytesIn)}, 送信 {DiscordBot.formatBytes(stats.bytesOut)})"
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def formatBytes(size: int) -> str:
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+            size /= 1024
+        return f"{size:.1f}GB"
+
+    @staticmethod
+    def setErrorEmbed(embed: discord.Embed, e: Exception):
+        embed.title = "エラー"
+        embed.description = "```\n"+str(e)+"\n```"
+        embed.color = discord.Color.red()
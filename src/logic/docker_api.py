@@ -0,0 +1,212 @@
+import http.client
+import json
+import queue
+import select
+import socket
+import struct
+from time import sleep
+from urllib.parse import quote, urlencode
+
+class DockerAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socketPath: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socketPath)
+        self.sock = sock
+
+class DockerAPIClient:
+    def __init__(self, socketPath: str = "/var/run/docker.sock", poolSize: int = 4, timeout: float = 60):
+        self.socketPath = socketPath
+        self.timeout = timeout
+        self.pool: queue.LifoQueue[UnixHTTPConnection] = queue.LifoQueue(maxsize=poolSize)
+
+    def acquire(self) -> UnixHTTPConnection:
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return UnixHTTPConnection(self.socketPath, timeout=self.timeout)
+
+    def release(self, conn: UnixHTTPConnection, reusable: bool):
+        if not reusable:
+            conn.close()
+            return
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def buildPath(path: str, params: dict | None = None) -> str:
+        if not params:
+            return path
+        return path + "?" + urlencode({key: (json.dumps(value) if isinstance(value, (dict, list)) else value) for key, value in params.items()})
+
+    def request(
+            self,
+            method: str,
+            path: str,
+            params: dict | None = None,
+            body: dict | bytes | None = None,
+            headers: dict[str, str] | None = None,
+            timeout: float | None = None
+        ) -> tuple[int, bytes]:
+        headers = dict(headers or {})
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+            headers.setdefault("Content-Type", "application/json")
+        for attempt in range(2):
+            conn = self.acquire()
+            reused = conn.sock is not None
+            try:
+                if reused:
+                    conn.sock.settimeout(timeout or self.timeout)
+                else:
+                    conn.timeout = timeout or self.timeout
+                conn.request(method, self.buildPath(path, params), body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            self.release(conn, not response.will_close)
+            return response.status, data
+        raise ConnectionError("Failed to reach the Docker daemon")
+
+    def requestJSON(self, method: str, path: str, expected: tuple[int, ...] = (200, 201, 204), **kwargs) -> dict | list | None:
+        status, data = self.request(method, path, **kwargs)
+        if status not in expected:
+            raise DockerAPIError(status, self.errorMessage(data))
+        if len(data) == 0:
+            return None
+        return json.loads(data)
+
+    @staticmethod
+    def errorMessage(data: bytes) -> str:
+        try:
+            return json.loads(data).get("message", "")
+        except (ValueError, AttributeError):
+            return data.decode(errors="replace")
+
+    def ping(self) -> bool:
+        try:
+            status, _ = self.request("GET", "/_ping", timeout=5)
+        except OSError:
+            return False
+        return status == 200
+
+    def containerPath(self, name: str, suffix: str = "") -> str:
+        return f"/containers/{quote(name, safe='')}{suffix}"
+
+    def createExec(self, name: str, cmd: list[str], workDir: str | None = None, stdin: bool = False) -> str:
+        config = {"AttachStdout": True, "AttachStderr": True, "AttachStdin": stdin, "Tty": False, "Cmd": cmd}
+        if workDir is not None:
+            config["WorkingDir"] = workDir
+        return self.requestJSON("POST", self.containerPath(name, "/exec"), body=config)["Id"]
+
+    def execExitCode(self, execID: str) -> int:
+        for _ in range(10):
+            info = self.requestJSON("GET", f"/exec/{execID}/json")
+            if not info["Running"]:
+                return info["ExitCode"] if info["ExitCode"] is not None else -1
+            sleep(0.1)
+        return -1
+
+    def attachExec(self, execID: str) -> "ExecSocket":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socketPath)
+        body = json.dumps({"Detach": False, "Tty": False}).encode()
+        request = (
+            f"POST /exec/{execID}/start HTTP/1.1\r\n"
+            "Host: localhost\r\n"
+            "Content-Type: application/json\r\n"
+            "Connection: Upgrade\r\n"
+            "Upgrade: tcp\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode() + body
+        sock.sendall(request)
+        buffer = b""
+        while b"\r\n\r\n" not in buffer:
+            chunk = sock.recv(4096)
+            if not chunk:
+                sock.close()
+                raise ConnectionError("Docker daemon closed the exec stream")
+            buffer += chunk
+        head, rest = buffer.split(b"\r\n\r\n", 1)
+        status = int(head.split(b" ", 2)[1])
+        if status not in (101, 200):
+            sock.close()
+            raise DockerAPIError(status, head.decode(errors="replace"))
+        sock.settimeout(None)
+        return ExecSocket(sock, rest)
+
+class ExecSocket:
+    def __init__(self, sock: socket.socket, initial: bytes = b""):
+        self.sock = sock
+        self.buffer = bytearray(initial)
+        self.closed = False
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def sendall(self, data: bytes):
+        self.sock.sendall(data)
+
+    def closeWrite(self):
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def read(self, timeout: float | None) -> list[tuple[int, bytes]]:
+        frames = self.parseFrames()
+        if self.closed:
+            return frames or [(1, b"")]
+        if frames:
+            return frames
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return []
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            self.closed = True
+            return [(1, b"")]
+        self.buffer += chunk
+        return self.parseFrames()
+
+    def parseFrames(self) -> list[tuple[int, bytes]]:
+        frames = []
+        while len(self.buffer) >= 8:
+            stream, size = struct.unpack(">BxxxL", self.buffer[:8])
+            if len(self.buffer) < 8 + size:
+                break
+            if size > 0:
+                frames.append((2 if stream == 2 else 1, bytes(self.buffer[8:8 + size])))
+            del self.buffer[:8 + size]
+        return frames
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
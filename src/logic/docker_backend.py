@@ -0,0 +1,521 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import select
+import subprocess
+import time
+from typing import Callable, Iterable
+from urllib.parse import quote
+
+from logic.docker_api import DockerAPIClient, DockerAPIError, ExecSocket
+from logic.output_buffer import OUTPUT_LIMIT, TailBuffer
+
+def parseSize(value: str) -> int:
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    value = value.strip().lower().removesuffix("b")
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def formatSize(size: int) -> str:
+    for unit, scale in (("gb", 1024 ** 3), ("mb", 1024 ** 2), ("kb", 1024)):
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return f"{size // 1024 ** 2}mb" if size >= 1024 ** 2 else str(size)
+
+def parseStatSize(value: str) -> int:
+    match = re.fullmatch(r"([\d.]+)\s*([kmgt]?)i?b", value.strip().lower())
+    if match is None:
+        return 0
+    return int(float(match.group(1)) * 1024 ** " kmgt".index(match.group(2) or " "))
+
+def nameFilter(name: str) -> str:
+    return f"^/?{re.escape(name)}$"
+
+def captureProcess(args: list[str], maxBytes: int = OUTPUT_LIMIT) -> subprocess.CompletedProcess[str]:
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = TailBuffer(maxBytes), TailBuffer(maxBytes)
+    buffers = {proc.stdout.fileno(): stdout, proc.stderr.fileno(): stderr}
+    try:
+        while buffers:
+            ready, _, _ = select.select(list(buffers), [], [])
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    buffers[fd].write(chunk)
+                else:
+                    del buffers[fd]
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+        proc.wait()
+    return subprocess.CompletedProcess(args, proc.returncode, stdout.text(), stderr.text())
+
+class ContainerStats:
+    def __init__(self, cpuPercent: float, memoryBytes: int, memoryLimit: int):
+        self.cpuPercent = cpuPercent
+        self.memoryBytes = memoryBytes
+        self.memoryLimit = memoryLimit
+
+    @property
+    def memoryPercent(self) -> float:
+        return self.memoryBytes / self.memoryLimit * 100 if self.memoryLimit > 0 else 0.0
+
+class ShellChannel:
+    def write(self, data: bytes):
+        raise NotImplementedError()
+
+    def read(self, timeout: float) -> list[tuple[int, bytes]]:
+        raise NotImplementedError()
+
+    def wait(self) -> int:
+        raise NotImplementedError()
+
+    def isAlive(self) -> bool:
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+class ProcessShellChannel(ShellChannel):
+    def __init__(self, args: list[str], cwd: str | None = None, env: dict[str, str] | None = None):
+        self.proc = subprocess.Popen(args, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.streams = {self.proc.stdout.fileno(): 1, self.proc.stderr.fileno(): 2}
+
+    def write(self, data: bytes):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def read(self, timeout: float) -> list[tuple[int, bytes]]:
+        ready, _, _ = select.select(list(self.streams), [], [], timeout)
+        chunks = []
+        for fd in ready:
+            data = os.read(fd, 65536)
+            chunks.append((self.streams[fd], data))
+            if data == b"":
+                del self.streams[fd]
+        return chunks
+
+    def wait(self) -> int:
+        return self.proc.wait()
+
+    def isAlive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+
+class APIShellChannel(ShellChannel):
+    def __init__(self, client: DockerAPIClient, execID: str):
+        self.client = client
+        self.execID = execID
+        self.sock: ExecSocket = client.attachExec(execID)
+
+    def write(self, data: bytes):
+        self.sock.sendall(data)
+
+    def read(self, timeout: float) -> list[tuple[int, bytes]]:
+        frames = self.sock.read(timeout)
+        # Both streams share the socket, so its end is the end of each.
+        if (1, b"") in frames:
+            frames.append((2, b""))
+        return frames
+
+    def wait(self) -> int:
+        return self.client.execExitCode(self.execID)
+
+    def isAlive(self) -> bool:
+        return not self.sock.closed
+
+    def close(self):
+        self.sock.closeWrite()
+        self.sock.close()
+
+class DockerBackend:
+    name = ""
+
+    def isAvailable(self) -> bool:
+        raise NotImplementedError()
+
+    def runContainer(self, name: str, image: str, cpu: float, ram: str, swap: str) -> bool:
+        raise NotImplementedError()
+
+    def stopContainer(self, name: str) -> bool:
+        raise NotImplementedError()
+
+    def containerExists(self, name: str) -> bool:
+        raise NotImplementedError()
+
+    def listContainers(self, prefix: str) -> list[str]:
+        raise NotImplementedError()
+
+    def renameContainer(self, name: str, newName: str) -> bool:
+        raise NotImplementedError()
+
+    def imageExists(self, image: str) -> bool:
+        raise NotImplementedError()
+
+    def commitContainer(self, name: str, image: str) -> bool:
+        raise NotImplementedError()
+
+    def removeImage(self, image: str) -> bool:
+        raise NotImplementedError()
+
+    def imageSize(self, image: str) -> int | None:
+        raise NotImplementedError()
+
+    def listImages(self, repository: str) -> list[str]:
+        raise NotImplementedError()
+
+    def containerStats(self, names: list[str]) -> dict[str, ContainerStats]:
+        raise NotImplementedError()
+
+    def updateContainer(self, name: str, cpu: float, ram: str, swap: str) -> bool:
+        raise NotImplementedError()
+
+    def execCommand(self, name: str, workDir: str, cmd: str, timeout: int) -> subprocess.CompletedProcess[str]:
+        raise NotImplementedError()
+
+    async def execCommandAsync(
+            self,
+            name: str,
+            workDir: str,
+            cmd: str,
+            timeout: int,
+            onOutput: Callable[[bytes], None] | None = None
+        ) -> subprocess.CompletedProcess[str]:
+        proc = await asyncio.to_thread(self.execCommand, name, workDir, cmd, timeout)
+        if onOutput is None:
+            return proc
+        onOutput((proc.stdout + proc.stderr).encode())
+        return subprocess.CompletedProcess(cmd, proc.returncode, "", "")
+
+    def writeStream(self, name: str, cmd: str, chunks: Iterable[bytes], timeout: int) -> subprocess.CompletedProcess[str]:
+        raise NotImplementedError()
+
+    def openShell(self, name: str) -> ShellChannel:
+        raise NotImplementedError()
+
+class DockerCLIBackend(DockerBackend):
+    name = "cli"
+
+    def isAvailable(self) -> bool:
+        try:
+            proc = subprocess.run(["docker", "--version"], capture_output=True, text=True)
+        except OSError:
+            return False
+        return proc.returncode == 0
+
+    def runContainer(self, name: str, image: str, cpu: float, ram: str, swap: str) -> bool:
+        return subprocess.run(["docker", "run", "-P", "--name", name, "-d", "--rm", f"--memory={ram}", f"--memory-swap={swap}", f"--cpus={cpu}", image, "tail", "-f", "/dev/null"]).returncode == 0
+
+    def stopContainer(self, name: str) -> bool:
+        return subprocess.run(["docker", "stop", name]).returncode == 0
+
+    def containerExists(self, name: str) -> bool:
+        proc = subprocess.run(["docker", "ps", "-a", "--filter", "name=" + nameFilter(name), "--format", "{{.Names}}"], capture_output=True, text=True)
+        return len(proc.stdout) > 0
+
+    def listContainers(self, prefix: str) -> list[str]:
+        proc = subprocess.run(["docker", "ps", "--filter", f"name=^/?{re.escape(prefix)}", "--format", "{{.Names}}"], capture_output=True, text=True)
+        return proc.stdout.split()
+
+    def renameContainer(self, name: str, newName: str) -> bool:
+        return subprocess.run(["docker", "rename", name, newName]).returncode == 0
+
+    def imageExists(self, image: str) -> bool:
+        return subprocess.run(["docker", "image", "inspect", image], capture_output=True).returncode == 0
+
+    def commitContainer(self, name: str, image: str) -> bool:
+        return subprocess.run(["docker", "commit", name, image], capture_output=True).returncode == 0
+
+    def removeImage(self, image: str) -> bool:
+        return subprocess.run(["docker", "rmi", image], capture_output=True).returncode == 0
+
+    def imageSize(self, image: str) -> int | None:
+        proc = subprocess.run(["docker", "image", "inspect", "--format", "{{.Size}}", image], capture_output=True, text=True)
+        if proc.returncode != 0 or not proc.stdout.strip().isdigit():
+            return None
+        return int(proc.stdout.strip())
+
+    def listImages(self, repository: str) -> list[str]:
+        proc = subprocess.run(["docker", "images", "--format", "{{.Repository}}:{{.Tag}}", repository], capture_output=True, text=True)
+        return proc.stdout.split()
+
+    def containerStats(self, names: list[str]) -> dict[str, ContainerStats]:
+        if len(names) == 0:
+            return {}
+        proc = subprocess.run(["docker", "stats", "--no-stream", "--format", "{{json .}}", *names], capture_output=True, text=True)
+        stats = {}
+        for line in proc.stdout.splitlines():
+            try:
+                entry = json.loads(line)
+                usage, _, limit = entry["MemUsage"].partition("/")
+                stats[entry["Name"]] = ContainerStats(float(entry["CPUPerc"].rstrip("%") or 0), parseStatSize(usage), parseStatSize(limit))
+            except (ValueError, KeyError):
+                continue
+        return stats
+
+    def updateContainer(self, name: str, cpu: float, ram: str, swap: str) -> bool:
+        return subprocess.run(["docker", "update", f"--cpus={cpu}", f"--memory={ram}", f"--memory-swap={swap}", name], capture_output=True).returncode == 0
+
+    def execCommand(self, name: str, workDir: str, cmd: str, timeout: int) -> subprocess.CompletedProcess[str]:
+        proc = captureProcess(["docker", "exec", "-w", workDir, name, "timeout", str(timeout), "bash", "-c", cmd])
+        return subprocess.CompletedProcess(cmd, proc.returncode, proc.stdout, proc.stderr)
+
+    async def execCommandAsync(
+            self,
+            name: str,
+            workDir: str,
+            cmd: str,
+            timeout: int,
+            onOutput: Callable[[bytes], None] | None = None
+        ) -> subprocess.CompletedProcess[str]:
+        proc = await asyncio.create_subprocess_exec(
+            "docker", "exec", "-w", workDir, name, "timeout", str(timeout), "bash", "-c", cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = TailBuffer(OUTPUT_LIMIT), TailBuffer(OUTPUT_LIMIT)
+        async def pump(stream: asyncio.StreamReader, buffer: TailBuffer):
+            while chunk := await stream.read(65536):
+                (onOutput or buffer.write)(chunk)
+        await asyncio.gather(pump(proc.stdout, stdout), pump(proc.stderr, stderr))
+        await proc.wait()
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout.text(), stderr.text())
+
+    def writeStream(self, name: str, cmd: str, chunks: Iterable[bytes], timeout: int) -> subprocess.CompletedProcess[str]:
+        proc = subprocess.Popen(["docker", "exec", "-i", name, "timeout", str(timeout), "bash", "-c", cmd], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout + 30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            stdout, stderr = proc.communicate()
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace"))
+
+    def openShell(self, name: str) -> ShellChannel:
+        return ProcessShellChannel(["docker", "exec", "-i", name, "bash", "--noprofile", "--norc"])
+
+class DockerAPIBackend(DockerBackend):
+    name = "api"
+
+    def __init__(self, socketPath: str = "/var/run/docker.sock", poolSize: int = 4):
+        self.client = DockerAPIClient(socketPath=socketPath, poolSize=poolSize)
+        self.cpuSamples: dict[str, tuple[int, int]] = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def isAvailable(self) -> bool:
+        return self.client.ping()
+
+    def pullImage(self, image: str):
+        repository, _, tag = image.partition(":")
+        self.logger.info(f"Pulling image: {image}")
+        status, data = self.client.request("POST", "/images/create", params={"fromImage": repository, "tag": tag or "latest"}, timeout=600)
+        if status != 200:
+            raise DockerAPIError(status, self.client.errorMessage(data))
+
+    def runContainer(self, name: str, image: str, cpu: float, ram: str, swap: str) -> bool:
+        config = {
+            "Image": image,
+            "Cmd": ["tail", "-f", "/dev/null"],
+            "HostConfig": {
+                "PublishAllPorts": True,
+                "AutoRemove": True,
+                "Memory": parseSize(ram),
+                "MemorySwap": parseSize(swap),
+                "NanoCpus": int(cpu * 1e9)
+            }
+        }
+        try:
+            try:
+                self.client.requestJSON("POST", "/containers/create", params={"name": name}, body=config)
+            except DockerAPIError as e:
+                if e.status != 404:
+                    raise
+                self.pullImage(image)
+                self.client.requestJSON("POST", "/containers/create", params={"name": name}, body=config)
+            self.client.requestJSON("POST", self.client.containerPath(name, "/start"), expected=(204, 304))
+        except (DockerAPIError, OSError) as e:
+            self.logger.error(f"Failed to run container {name}: {e}")
+            return False
+        return True
+
+    def stopContainer(self, name: str) -> bool:
+        try:
+            self.client.requestJSON("POST", self.client.containerPath(name, "/stop"), expected=(204, 304), timeout=60)
+        except (DockerAPIError, OSError) as e:
+            self.logger.error(f"Failed to stop container {name}: {e}")
+            return False
+        return True
+
+    def containerExists(self, name: str) -> bool:
+        containers = self.client.requestJSON("GET", "/containers/json", params={"all": 1, "filters": {"name": [nameFilter(name)]}})
+        return len(containers) > 0
+
+    def listContainers(self, prefix: str) -> list[str]:
+        containers = self.client.requestJSON("GET", "/containers/json", params={"filters": {"name": [f"^/?{re.escape(prefix)}"]}})
+        return [container["Names"][0].lstrip("/") for container in containers]
+
+    def renameContainer(self, name: str, newName: str) -> bool:
+        try:
+            self.client.requestJSON("POST", self.client.containerPath(name, "/rename"), params={"name": newName})
+        except (DockerAPIError, OSError) as e:
+            self.logger.error(f"Failed to rename container {name} to {newName}: {e}")
+            return False
+        return True
+
+    def imageExists(self, image: str) -> bool:
+        status, _ = self.client.request("GET", f"/images/{quote(image, safe='')}/json")
+        return status == 200
+
+    def commitContainer(self, name: str, image: str) -> bool:
+        repository, _, tag = image.rpartition(":")
+        try:
+            self.client.requestJSON("POST", "/commit", params={"container": name, "repo": repository, "tag": tag, "pause": 1}, timeout=600)
+        except (DockerAPIError, OSError) as e:
+            self.logger.error(f"Failed to commit container {name} to {image}: {e}")
+            return False
+        return True
+
+    def removeImage(self, image: str) -> bool:
+        try:
+            self.client.requestJSON("DELETE", f"/images/{quote(image, safe='')}")
+        except (DockerAPIError, OSError) as e:
+            self.logger.warning(f"Failed to remove image {image}: {e}")
+            return False
+        return True
+
+    def imageSize(self, image: str) -> int | None:
+        try:
+            return self.client.requestJSON("GET", f"/images/{quote(image, safe='')}/json")["Size"]
+        except (DockerAPIError, OSError, KeyError):
+            return None
+
+    def listImages(self, repository: str) -> list[str]:
+        images = self.client.requestJSON("GET", "/images/json", params={"filters": {"reference": [repository]}})
+        return [tag for image in images for tag in image.get("RepoTags") or [] if tag.startswith(f"{repository}:")]
+
+    def containerStats(self, names: list[str]) -> dict[str, ContainerStats]:
+        stats = {}
+        for name in names:
+            try:
+                data = self.client.requestJSON("GET", self.client.containerPath(name, "/stats"), params={"stream": 0, "one-shot": 1})
+                cpuStats = data["cpu_stats"]
+                memoryStats = data["memory_stats"]
+            except (DockerAPIError, OSError, KeyError, TypeError):
+                continue
+            total = cpuStats["cpu_usage"]["total_usage"]
+            system = cpuStats.get("system_cpu_usage", 0)
+            previous = self.cpuSamples.get(name)
+            self.cpuSamples[name] = (total, system)
+            cpuPercent = 0.0
+            if previous is not None and system > previous[1]:
+                cpuPercent = (total - previous[0]) / (system - previous[1]) * cpuStats.get("online_cpus", 1) * 100
+            cache = memoryStats.get("stats", {}).get("inactive_file", 0)
+            stats[name] = ContainerStats(cpuPercent, max(0, memoryStats.get("usage", 0) - cache), memoryStats.get("limit", 0))
+        for name in set(self.cpuSamples) - set(names):
+            del self.cpuSamples[name]
+        return stats
+
+    def updateContainer(self, name: str, cpu: float, ram: str, swap: str) -> bool:
+        try:
+            self.client.requestJSON("POST", self.client.containerPath(name, "/update"), body={"NanoCpus": int(cpu * 1e9), "Memory": parseSize(ram), "MemorySwap": parseSize(swap)})
+        except (DockerAPIError, OSError) as e:
+            self.logger.error(f"Failed to update container {name}: {e}")
+            return False
+        return True
+
+    def execCommand(self, name: str, workDir: str, cmd: str, timeout: int) -> subprocess.CompletedProcess[str]:
+        buffers = {1: TailBuffer(OUTPUT_LIMIT), 2: TailBuffer(OUTPUT_LIMIT)}
+        try:
+            execID = self.client.createExec(name, ["timeout", str(timeout), "bash", "-c", cmd], workDir=workDir)
+            sock = self.client.attachExec(execID)
+            try:
+                deadline = time.monotonic() + timeout + 30
+                while not sock.closed and time.monotonic() < deadline:
+                    for stream, data in sock.read(max(0, deadline - time.monotonic())):
+                        buffers[stream].write(data)
+            finally:
+                sock.close()
+            returncode = self.client.execExitCode(execID)
+        except (DockerAPIError, OSError) as e:
+            return subprocess.CompletedProcess(cmd, 1, "", str(e))
+        return subprocess.CompletedProcess(cmd, returncode, buffers[1].text(), buffers[2].text())
+
+    def execStream(self, name: str, workDir: str, cmd: str, timeout: int, onOutput: Callable[[bytes], None]) -> subprocess.CompletedProcess[str]:
+        try:
+            execID = self.client.createExec(name, ["timeout", str(timeout), "bash", "-c", cmd], workDir=workDir)
+            sock = self.client.attachExec(execID)
+            try:
+                while not sock.closed:
+                    for _, data in sock.read(None):
+                        if data:
+                            onOutput(data)
+            finally:
+                sock.close()
+            returncode = self.client.execExitCode(execID)
+        except (DockerAPIError, OSError) as e:
+            return subprocess.CompletedProcess(cmd, 1, "", str(e))
+        return subprocess.CompletedProcess(cmd, returncode, "", "")
+
+    async def execCommandAsync(
+            self,
+            name: str,
+            workDir: str,
+            cmd: str,
+            timeout: int,
+            onOutput: Callable[[bytes], None] | None = None
+        ) -> subprocess.CompletedProcess[str]:
+        if onOutput is None:
+            return await super().execCommandAsync(name, workDir, cmd, timeout)
+        return await asyncio.to_thread(self.execStream, name, workDir, cmd, timeout, onOutput)
+
+    def writeStream(self, name: str, cmd: str, chunks: Iterable[bytes], timeout: int) -> subprocess.CompletedProcess[str]:
+        output = {1: bytearray(), 2: bytearray()}
+        try:
+            execID = self.client.createExec(name, ["timeout", str(timeout), "bash", "-c", cmd], stdin=True)
+            sock = self.client.attachExec(execID)
+            try:
+                try:
+                    for chunk in chunks:
+                        sock.sendall(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                sock.closeWrite()
+                deadline = time.monotonic() + timeout + 30
+                while not sock.closed and time.monotonic() < deadline:
+                    for stream, data in sock.read(max(0, deadline - time.monotonic())):
+                        output[stream] += data
+            finally:
+                sock.close()
+            returncode = self.client.execExitCode(execID)
+        except (DockerAPIError, OSError) as e:
+            return subprocess.CompletedProcess(cmd, 1, "", str(e))
+        return subprocess.CompletedProcess(cmd, returncode, output[1].decode(errors="replace"), output[2].decode(errors="replace"))
+
+    def openShell(self, name: str) -> ShellChannel:
+        execID = self.client.createExec(name, ["bash", "--noprofile", "--norc"], stdin=True)
+        return APIShellChannel(self.client, execID)
+
+def createBackend(name: str = "cli") -> DockerBackend:
+    if name == "cli":
+        return DockerCLIBackend()
+    if name == "api":
+        return DockerAPIBackend()
+    raise ValueError(f"Unknown docker backend: {name}")
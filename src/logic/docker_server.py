@@ -1,7 +1,23 @@
+import asyncio
 import logging
+import posixpath
+import shlex
 import subprocess
-import base64
-import os
+import threading
+from contextlib import nullcontext
+from typing import Callable, Iterable
+from uuid import uuid4
+
+from logic.checkpoint_store import Checkpoint, CheckpointStore
+from logic.command_cache import CommandCache, isReadOnly
+from logic.container_pool import PROVISION_COMMAND, ContainerPool
+from logic.directory_index import DirectoryIndex
+from logic.docker_backend import DockerBackend, createBackend
+from logic.file_transfer import FileTransfer
+from logic.port_forwarder import PortForwarder, PortStats
+from logic.resource_monitor import ResourceMonitor
+from logic.shell_session import ShellSession
+from logic.tracing import tracer
 
 class DockerServer:
     def __init__(
@@ -10,122 +26,287 @@ class DockerServer:
             id: str = "openai",
             cpu: float = 2.0,
             ram: str = "2gb",
-            swap: str = "2gb"
+            swap: str = "2gb",
+            useSession: bool = True,
+            backend: str | DockerBackend = "cli",
+            pool: ContainerPool | None = None,
+            forwarder: PortForwarder | None = None,
+            commandCache: CommandCache | None = None,
+            useDirectoryIndex: bool = True,
+            provisionCommand: str | None = PROVISION_COMMAND,
+            checkpoints: CheckpointStore | None = None,
+            monitor: ResourceMonitor | None = None
         ):
         self.containerName = containerName
         self.id = id
+        self.name = f"{containerName}.{id}"
         self.cpu = cpu
         self.ram = ram
         self.swap = swap
+        self.baseLimits = (cpu, ram, swap)
+        self.monitor = monitor
         self._running = False
         self.workDir = "/root"
         self.homeDir = "/root"
-        self.ports = {}
+        self.ports: dict[int, int] = {}
+        self.forwarder = forwarder or PortForwarder()
+        self.backend = createBackend(backend) if isinstance(backend, str) else backend
+        self.pool = pool
+        self.provisionCommand = provisionCommand
+        self.transfer = FileTransfer(self.backend)
+        self.commandCache = commandCache
+        self.generation = 0
+        self.checkpoints = checkpoints
+        self.image = containerName
+        self.dirty = False
+        self.useSession = useSession
+        self.session = ShellSession(self.name, self.backend) if useSession else None
+        self.directoryIndex = DirectoryIndex(self.backend) if useDirectoryIndex else None
         self.logger = logging.getLogger(self.__class__.__name__+ "-" + self.containerName)
         self.logger.level = logging.INFO
-        if not self.checkDockerInstalled():
-            self.logger.error("Docker is not installed")
-            exit(1)
 
-    def start(self):
+    def start(self, image: str | None = None):
         if not self.isRunning():
-            logging.info(f"Starting Container")
-            subprocess.run(["docker", "run", "-P", "--name", f"{self.containerName}.{self.id}", "-d", "--rm", f"--memory={self.ram}", f"--memory-swap={self.swap}", f"--cpus={self.cpu}", self.containerName, "tail", "-f", "/dev/null"])
-            self.runCommand("apt update && apt install -y iproute2")
-            for port in self.ports:
-                self.openPort(port)
+            with tracer.span("start", containerName=self.name) as span:
+                self.image = self.launch(image, span)
+            if self.checkpoints is not None:
+                self.checkpoints.use(self.name, self.image)
+            self.dirty = False
+            self.attach()
+        elif not self._running:
+            logging.info(f"Reattaching to running container")
+            if self.checkpoints is not None:
+                self.checkpoints.use(self.name, self.image)
+            self.dirty = True
+            self.attach()
         self._running = True
+
+    def launch(self, image: str | None, span) -> str:
+        if image is None and self.pool is not None and self.pool.acquire(self.name, self.cpu, self.ram, self.swap):
+            span.set(pooled=True)
+            return self.pool.resolveImage()
+        span.set(pooled=False)
+        baseImage = self.pool.resolveImage() if self.pool is not None else self.containerName
+        if image is None and self.checkpoints is not None:
+            image = self.checkpoints.baseline(baseImage)
+        logging.info(f"Starting Container")
+        self.backend.runContainer(self.name, image or baseImage, self.cpu, self.ram, self.swap)
+        if image is not None:
+            return image
+        if self.provisionCommand is not None:
+            with tracer.span("provision", containerName=self.name):
+                self.runCommand(self.provisionCommand)
+        if self.checkpoints is not None:
+            with tracer.span("checkpoint", "baseline", containerName=self.name):
+                self.checkpoints.saveBaseline(self.name, baseImage)
+        return baseImage
+
+    def attach(self):
+        self.newGeneration()
+        if self.monitor is not None:
+            self.monitor.register(self)
+        if self.directoryIndex is not None:
+            self.directoryIndex.start(self.name)
+        for port in self.ports:
+            self.openPort(port)
     
-    def stop(self):
+    def stop(self, wait: bool = True):
         if self.isRunning():
             logging.info(f"Stopping Container")
             ports = self.ports.copy()
             for port in ports:
                 self.closePort(port)
-            subprocess.run(["docker", "stop", f"{self.containerName}.{self.id}"])
+            if self.session is not None:
+                self.session.close()
+            if self.directoryIndex is not None:
+                self.directoryIndex.stop()
+            if self.monitor is not None:
+                self.monitor.unregister(self.name)
+            retiredName = f"{self.name}.retired-{uuid4().hex[:8]}"
+            if not wait and self.backend.renameContainer(self.name, retiredName):
+                threading.Thread(target=self.backend.stopContainer, args=(retiredName,), daemon=True).start()
+            else:
+                self.backend.stopContainer(self.name)
+            self.newGeneration()
+        self.cpu, self.ram, self.swap = self.baseLimits
         self._running = False
 
+    def resize(self, cpu: float, ram: str, swap: str) -> bool:
+        if not self.backend.updateContainer(self.name, cpu, ram, swap):
+            self.logger.warning(f"Failed to resize container to {cpu} CPU, {ram} RAM, {swap} swap")
+            return False
+        self.logger.info(f"Resized container from {self.cpu} CPU, {self.ram} RAM to {cpu} CPU, {ram} RAM")
+        self.cpu, self.ram, self.swap = cpu, ram, swap
+        return True
+
+    def reset(self):
+        self.stop(wait=False)
+        self.start()
+        self.workDir = self.homeDir
+
+    def checkpoint(self, label: str) -> Checkpoint | None:
+        if self.checkpoints is None or not self._running or not self.dirty:
+            return None
+        with tracer.span("checkpoint", containerName=self.name):
+            checkpoint = self.checkpoints.create(self.name, label, self.workDir)
+        if checkpoint is not None:
+            self.dirty = False
+        return checkpoint
+
+    def restore(self, checkpointID: int) -> bool:
+        checkpoint = self.checkpoints.get(self.name, checkpointID) if self.checkpoints is not None else None
+        if checkpoint is None:
+            return False
+        ports = list(self.ports)
+        with tracer.span("restore", containerName=self.name):
+            self.stop(wait=False)
+            self.start(checkpoint.image)
+        self.workDir = checkpoint.workDir
+        for port in ports:
+            self.openPort(port)
+        return True
+
+    def newGeneration(self):
+        self.generation += 1
+        if self.commandCache is not None:
+            self.commandCache.invalidate()
+
     def checkDockerInstalled(self) -> bool:
-        proc = subprocess.run(["docker", "--version"], capture_output=True, text=True)
-        return proc.returncode == 0
+        return self.backend.isAvailable()
 
     def isRunning(self) -> bool:
-        proc = subprocess.run(["docker", "ps", "-a", "--filter", "name=" + f"{self.containerName}.{self.id}", "--format", "{{.Names}}"], capture_output=True, text=True)
-        return len(proc.stdout) > 0
+        return self.backend.containerExists(self.name)
     
-    def runCommand(self, cmd: str) -> subprocess.CompletedProcess[str]:
-        proc = subprocess.run(["docker", "exec", "-w", self.workDir, f"{self.containerName}.{self.id}", "timeout", str(600), "bash", "-c", cmd], capture_output=True, text=True)
+    def cacheKey(self, cmd: str, cacheable: bool | None, streaming: bool) -> tuple | None:
+        if self.commandCache is None:
+            return None
+        if not (self.commandCache.isCacheable(cmd) if cacheable is None else cacheable):
+            self.commandCache.bypass()
+            return None
+        return (cmd, self.workDir, self.generation, streaming)
+
+    def storeResult(self, key: tuple | None, proc: subprocess.CompletedProcess[str]):
+        if self.commandCache is None:
+            return
+        if key is None:
+            self.commandCache.invalidate()
+        elif proc.returncode != 124:
+            self.commandCache.put(key, proc)
+
+    def runCommand(self, cmd: str, cacheable: bool | None = None) -> subprocess.CompletedProcess[str]:
+        if not cacheable:
+            self.dirty = True
+        key = self.cacheKey(cmd, cacheable, False)
+        if key is not None and (proc := self.commandCache.get(key)) is not None:
+            tracer.count("command_cache_hits_total")
+            return proc
+        with self.indexMutation(not (isReadOnly(cmd) if cacheable is None else cacheable)) as epilogue:
+            proc = self.runUncached(cmd, epilogue or "")
+        self.storeResult(key, proc)
+        return proc
+
+    def indexMutation(self, mutating: bool = True):
+        if not mutating or self.directoryIndex is None:
+            return nullcontext()
+        return self.directoryIndex.mutation()
+
+    def runUncached(self, cmd: str, epilogue: str = "") -> subprocess.CompletedProcess[str]:
+        with tracer.span("command", cmd=cmd[:200]) as span:
+            if self.session is not None:
+                proc = self.session.run(cmd, self.workDir, epilogue=epilogue)
+                if proc is not None:
+                    span.set(transport="session", returncode=proc.returncode)
+                    return proc
+            proc = self.execCommand(cmd)
+            span.set(transport="exec", returncode=proc.returncode)
+            return proc
+
+    def execCommand(self, cmd: str) -> subprocess.CompletedProcess[str]:
+        return self.backend.execCommand(self.name, self.workDir, cmd, 600)
+
+    async def runCommandAsync(self, cmd: str, onOutput: Callable[[bytes], None] | None = None) -> subprocess.CompletedProcess[str]:
+        self.dirty = True
+        key = self.cacheKey(cmd, None, onOutput is not None)
+        if key is not None and (proc := self.commandCache.get(key)) is not None:
+            tracer.count("command_cache_hits_total")
+            if onOutput is None:
+                return proc
+            onOutput(proc.stdout.encode())
+            return subprocess.CompletedProcess(cmd, proc.returncode, "", "")
+        captured = None
+        if key is not None and onOutput is not None:
+            captured = bytearray()
+            sink = onOutput
+            def onOutput(chunk: bytes):
+                if len(captured) <= self.commandCache.maxOutputChars:
+                    captured.extend(chunk)
+                sink(chunk)
+        with self.indexMutation(not isReadOnly(cmd)) as epilogue:
+            proc = await self.runUncachedAsync(cmd, onOutput, epilogue or "")
+        self.storeResult(key, proc if captured is None else subprocess.CompletedProcess(cmd, proc.returncode, captured.decode(errors="replace"), ""))
         return proc
+
+    async def runUncachedAsync(self, cmd: str, onOutput: Callable[[bytes], None] | None = None, epilogue: str = "") -> subprocess.CompletedProcess[str]:
+        async with tracer.span("command", cmd=cmd[:200]) as span:
+            if self.session is not None:
+                proc = await asyncio.to_thread(self.session.run, cmd, self.workDir, onOutput, epilogue)
+                if proc is not None:
+                    span.set(transport="session", returncode=proc.returncode)
+                    return proc
+            proc = await self.backend.execCommandAsync(self.name, self.workDir, cmd, 600, onOutput)
+            span.set(transport="exec", returncode=proc.returncode)
+            return proc
     
     def checkFolder(self, path: str) -> bool:
-        proc = self.runCommand(f"test -d {path}")
+        if self.directoryIndex is None:
+            sync = ""
+        elif self.directoryIndex.contains(path):
+            return True
+        else:
+            sync = self.directoryIndex.syncCommand()
+        proc = self.runCommand(f"{sync}test -d {shlex.quote(path)}", cacheable=True)
         return proc.returncode == 0
     
     def checkFile(self, path: str) -> bool:
-        proc = self.runCommand(f"test -f {path}")
+        proc = self.runCommand(f"test -f {shlex.quote(path)}", cacheable=True)
         return proc.returncode == 0
 
     def appendPath(self, path: str) -> str | None:
-        givenWorkDirList = path.split("/")
-        if len(givenWorkDirList) < 1:
+        if path == "":
             return None
-        if not path[0] == "/" and not givenWorkDirList[0] == "~" and not givenWorkDirList[0] == "." and not givenWorkDirList[0] == ".." and not self.workDir == "/":
-            givenWorkDirList[0] = self.workDir + "/" + givenWorkDirList[0]
-        if not path[0] == "/" and givenWorkDirList[0] == ".":
-            givenWorkDirList[0] = self.workDir
-        if givenWorkDirList[0] == "~":
-            givenWorkDirList[0] = self.homeDir
-        if givenWorkDirList[0] == "..":
-            givenWorkDirList.insert(0, self.workDir)
-        newPath = ""
-        for i in range(len(givenWorkDirList)):
-            if len(givenWorkDirList) < 1:
-                continue
-            if i > 0 and givenWorkDirList[i] == "" and not path == "/":
-                return None
-            if i > 0 and givenWorkDirList[i] == "~":
-                return None
-            if givenWorkDirList[i] == ".":
-                pass
-            elif givenWorkDirList[i] == "..":
-                newPathList = newPath.split("/")
-                newPath = "/".join(newPathList[:-1])
-                if len(newPath) == 0:
-                    newPath = "/"
-                if newPath[0] != "/":
-                    newPath = "/" + newPath
-            else:
-                newPath += ("/" if not (newPath.endswith("/") or givenWorkDirList[i].startswith("/")) else "") + givenWorkDirList[i]
-            if len(newPath) == 0:
-                newPath = "/"
-            if newPath[-1] == "/" and not newPath == "/":
-                newPath = newPath[:-1]
-        return newPath
+        parts = path.split("/")
+        if path != "/" and ("" in parts[1:] or "~" in parts[1:]):
+            return None
+        if parts[0] == "~":
+            path = self.homeDir + path[1:]
+        return posixpath.normpath(posixpath.join(self.workDir, path))
     
     def changeWorkDir(self, path: str) -> bool:
         newPath = self.appendPath(path)
-        if not self.checkFolder(newPath):
+        if newPath is None or not self.checkFolder(newPath):
             return False
         self.workDir = newPath
         return True
     
     def writeTextFile(self, path: str, value: str, mode: str) -> bool:
-        fullPath = self.appendPath(path)
-        b64 = base64.b64encode(value.encode()).decode()
-        p = ">" if mode == "create" else ">>"
-        return self.runCommand(f"echo {b64} | base64 -d {p} {fullPath}").returncode == 0
+        return self.writeRawFile(path, value.encode(), mode)
     
-    def writeRawFile(self, path: str, value: bytes) -> bool:
+    def writeRawFile(self, path: str, value: bytes | Iterable[bytes], mode: str = "create", onProgress: Callable[[int], None] | None = None) -> bool:
         fullPath = self.appendPath(path)
-        fileName = os.path.basename(fullPath)
-        if not os.path.exists(".temp"):
-            os.mkdir(".temp")
-        with open(f".temp/{fileName}", "wb") as f:
-            f.write(value)
-        return subprocess.run(["docker", "cp", f".temp/{fileName}", f"{self.containerName}.{self.id}:{fullPath}"]).returncode == 0
+        if fullPath is None:
+            return False
+        self.dirty = True
+        if self.commandCache is not None:
+            self.commandCache.invalidate()
+        try:
+            with self.indexMutation() as epilogue:
+                return self.transfer.upload(self.name, fullPath, value, mode, onProgress, epilogue or "")
+        finally:
+            if self.commandCache is not None:
+                self.commandCache.invalidate()
     
     def checkIPAddress(self) -> str | None:
-        proc = self.runCommand("ip addr show eth0 | grep -oP '(?<=inet\s)\d+(\.\d+){3}'")
+        proc = self.runCommand("ip addr show eth0 | grep -oP '(?<=inet\s)\d+(\.\d+){3}'", cacheable=True)
         if proc.returncode != 0:
             return None
         return proc.stdout.strip()
@@ -133,17 +314,21 @@ class DockerServer:
     def openPort(self, port: int) -> bool:
         if port in self.ports:
             return False
-        mappedPort = port % 10000 + 30000
         ipAddress = self.checkIPAddress()
         if ipAddress is None:
             return False
-        proc = subprocess.Popen(["socat", f"TCP-LISTEN:{mappedPort},fork,reuseaddr", f"TCP:{ipAddress}:{port}"])
-        self.ports[port] = proc
+        mappedPort = self.forwarder.open(ipAddress, port)
+        if mappedPort is None:
+            return False
+        self.ports[port] = mappedPort
         return True
     
     def closePort(self, port: int) -> bool:
         if not port in self.ports:
             return False
-        self.ports[port].kill()
+        self.forwarder.close(self.ports[port])
         del self.ports[port]
-        return True
\ No newline at end of file
+        return True
+
+    def portStats(self) -> dict[int, PortStats]:
+        return {port: self.forwarder.stats(mappedPort) or PortStats() for port, mappedPort in self.ports.items()}
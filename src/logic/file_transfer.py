@@ -0,0 +1,68 @@
+import hashlib
+import logging
+import shlex
+from typing import Callable, Iterable, Iterator
+
+from logic.docker_backend import DockerBackend
+
+class FileTransfer:
+    def __init__(self, backend: DockerBackend, chunkSize: int = 256 * 1024, timeout: int = 600):
+        self.backend = backend
+        self.chunkSize = chunkSize
+        self.timeout = timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def chunks(self, value: bytes) -> Iterator[bytes]:
+        view = memoryview(value)
+        for offset in range(0, len(view), self.chunkSize):
+            yield view[offset:offset + self.chunkSize]
+
+    @staticmethod
+    def command(path: str, mode: str) -> str:
+        quoted = shlex.quote(path)
+        if mode == "create":
+            return f"mkdir -p -- \"$(dirname -- {quoted})\" && cat > {quoted} && sha256sum < {quoted}"
+        return (
+            f"mkdir -p -- \"$(dirname -- {quoted})\" && "
+            f"offset=$(stat -c %s -- {quoted} 2> /dev/null || echo 0) && "
+            f"cat >> {quoted} && tail -c +$((offset + 1)) -- {quoted} | sha256sum"
+        )
+
+    def upload(
+            self,
+            name: str,
+            path: str,
+            source: bytes | Iterable[bytes],
+            mode: str = "create",
+            onProgress: Callable[[int], None] | None = None,
+            epilogue: str = ""
+        ) -> bool:
+        if mode not in ("create", "append"):
+            raise ValueError(f"Unknown write mode: {mode}")
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = self.chunks(source)
+        digest = hashlib.sha256()
+        sent = 0
+        def stream() -> Iterator[bytes]:
+            nonlocal sent
+            for chunk in source:
+                if not chunk:
+                    continue
+                digest.update(chunk)
+                yield chunk
+                sent += len(chunk)
+                if onProgress is not None:
+                    onProgress(sent)
+        command = self.command(path, mode)
+        if epilogue != "":
+            command = f"{{ {command}; }}; __rc=$?; {epilogue}; exit $__rc"
+        proc = self.backend.writeStream(name, command, stream(), self.timeout)
+        if proc.returncode != 0:
+            self.logger.error(f"Failed to write {name}:{path}: {proc.stderr.strip()}")
+            return False
+        remoteDigest = proc.stdout.split(" ", 1)[0].strip()
+        if remoteDigest != digest.hexdigest():
+            self.logger.error(f"Checksum mismatch for {name}:{path} after {sent} bytes: expected {digest.hexdigest()}, got {remoteDigest}")
+            return False
+        return True
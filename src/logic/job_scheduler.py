@@ -0,0 +1,156 @@
+import asyncio
+import heapq
+import logging
+import sqlite3
+from time import time
+from typing import Awaitable, Callable
+
+from logic.tracing import tracer
+
+class Job:
+    def __init__(self, id: int, sessionKey: str, userID: int, dueAt: int, message: str):
+        self.id = id
+        self.sessionKey = sessionKey
+        self.userID = userID
+        self.dueAt = dueAt
+        self.message = message
+
+class JobScheduler:
+    def __init__(
+            self,
+            onDue: Callable[[str, int, list[Job]], Awaitable[None]],
+            path: str = "jobs.db"
+        ):
+        self.onDue = onDue
+        self.path = path
+        self.jobs: dict[int, Job] = {}
+        self.heap: list[tuple[int, int]] = []
+        self.inFlight: set[int] = set()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.dispatches: set[asyncio.Task] = set()
+        self.fired = 0
+        self.coalesced = 0
+        self.deduplicated = 0
+        self.lastLateness = 0.0
+        self.maxLateness = 0.0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "sessionKey TEXT NOT NULL, "
+            "userID INTEGER NOT NULL, "
+            "dueAt INTEGER NOT NULL, "
+            "message TEXT NOT NULL, "
+            "UNIQUE(sessionKey, dueAt, message))"
+        )
+        self.db.commit()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def load(self):
+        for id, sessionKey, userID, dueAt, message in self.db.execute("SELECT id, sessionKey, userID, dueAt, message FROM jobs"):
+            self.push(Job(id, sessionKey, userID, dueAt, message))
+        self.logger.info(f"Loaded {len(self.jobs)} scheduled jobs")
+
+    def push(self, job: Job):
+        self.jobs[job.id] = job
+        heapq.heappush(self.heap, (job.dueAt, job.id))
+
+    def start(self):
+        if self.task is not None:
+            return
+        self.load()
+        tracer.collect("scheduler", self.metrics)
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def close(self):
+        self.db.close()
+
+    def schedule(self, sessionKey: str, userID: int, dueAt: int, message: str) -> bool:
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO jobs (sessionKey, userID, dueAt, message) VALUES (?, ?, ?, ?)",
+            (sessionKey, userID, dueAt, message)
+        )
+        self.db.commit()
+        if cursor.rowcount == 0:
+            self.deduplicated += 1
+            return False
+        self.push(Job(cursor.lastrowid, sessionKey, userID, dueAt, message))
+        if self.heap[0][1] == cursor.lastrowid:
+            self.wakeup.set()
+        return True
+
+    def nextDelay(self) -> float | None:
+        while self.heap and self.heap[0][1] not in self.jobs:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - time())
+
+    async def loop(self):
+        while True:
+            self.fireDue()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.nextDelay())
+            except asyncio.TimeoutError:
+                pass
+
+    def fireDue(self):
+        now = time()
+        due: dict[str, list[Job]] = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, id = heapq.heappop(self.heap)
+            job = self.jobs.get(id)
+            if job is None or id in self.inFlight:
+                continue
+            due.setdefault(job.sessionKey, []).append(job)
+        for sessionKey, jobs in due.items():
+            jobs.sort(key=lambda job: job.dueAt)
+            lateness = now - jobs[0].dueAt
+            self.lastLateness = lateness
+            self.maxLateness = max(self.maxLateness, lateness)
+            self.fired += 1
+            self.coalesced += len(jobs) - 1
+            self.inFlight.update(job.id for job in jobs)
+            self.logger.info(f"Firing {len(jobs)} job(s) for session {sessionKey} (lateness: {lateness:.1f}s)")
+            task = asyncio.create_task(self.dispatch(sessionKey, jobs))
+            self.dispatches.add(task)
+            task.add_done_callback(self.dispatches.discard)
+
+    async def dispatch(self, sessionKey: str, jobs: list[Job]):
+        try:
+            await self.onDue(sessionKey, jobs[0].userID, jobs)
+        except Exception as e:
+            self.logger.error(f"Scheduled job for session {sessionKey} failed: {e}")
+        finally:
+            self.db.executemany("DELETE FROM jobs WHERE id = ?", [(job.id,) for job in jobs])
+            self.db.commit()
+            for job in jobs:
+                self.jobs.pop(job.id, None)
+                self.inFlight.discard(job.id)
+
+    def hasPending(self, sessionKey: str) -> bool:
+        return any(job.sessionKey == sessionKey for job in self.jobs.values())
+
+    def metrics(self) -> dict[str, float]:
+        return {
+            "queueDepth": len(self.jobs) - len(self.inFlight),
+            "inFlight": len(self.inFlight),
+            "fired": self.fired,
+            "coalesced": self.coalesced,
+            "deduplicated": self.deduplicated,
+            "lastLateness": self.lastLateness,
+            "maxLateness": self.maxLateness
+        }
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Any, Awaitable, Callable, Hashable
+
+from logic.tracing import tracer
+
+class TokenBucket:
+    def __init__(self, capacity: int = 5, per: float = 5.0):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updatedAt = monotonic()
+
+    def delay(self) -> float:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self.tokens -= 1
+
+class PendingUpdate:
+    def __init__(self, target: Any):
+        self.target = target
+        self.state: Any = None
+        self.version = 0
+        self.sentVersion = 0
+        self.lastSent = 0.0
+        self.urgent = False
+        self.wakeup = asyncio.Event()
+        self.sent = asyncio.Condition()
+        self.task: asyncio.Task | None = None
+
+class MessageUpdater:
+    # Keeps only the newest state per message and sends it at most once per
+    # interval, within a shared per-channel bucket, so bursts of status
+    # changes collapse into a single edit.
+    def __init__(
+            self,
+            send: Callable[[Any, Any], Awaitable[None]],
+            key: Callable[[Any], Hashable] = lambda message: message.id,
+            bucketKey: Callable[[Any], Hashable] = lambda message: message.channel.id,
+            interval: float = 1.0,
+            capacity: int = 5,
+            per: float = 5.0
+        ):
+        self.send = send
+        self.key = key
+        self.bucketKey = bucketKey
+        self.interval = interval
+        self.capacity = capacity
+        self.per = per
+        self.pending: dict[Hashable, PendingUpdate] = {}
+        self.buckets: dict[Hashable, TokenBucket] = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def bucket(self, target: Any) -> TokenBucket:
+        key = self.bucketKey(target)
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(self.capacity, self.per)
+        return self.buckets[key]
+
+    def update(self, target: Any, state: Any) -> PendingUpdate:
+        key = self.key(target)
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = PendingUpdate(target)
+        if pending.version > pending.sentVersion:
+            tracer.count("discord_updates_dropped_total")
+        pending.state = state
+        pending.version += 1
+        if pending.task is None:
+            pending.task = asyncio.create_task(self.flush(pending))
+        return pending
+
+    async def commit(self, target: Any, state: Any):
+        pending = self.update(target, state)
+        version = pending.version
+        pending.urgent = True
+        pending.wakeup.set()
+        async with pending.sent:
+            await pending.sent.wait_for(lambda: pending.sentVersion >= version)
+        if pending.sentVersion == pending.version:
+            self.pending.pop(self.key(target), None)
+
+    async def flush(self, pending: PendingUpdate):
+        try:
+            while pending.sentVersion < pending.version:
+                wait = pending.lastSent + self.interval - monotonic()
+                if wait > 0 and not pending.urgent:
+                    pending.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(pending.wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                await self.bucket(pending.target).acquire()
+                version, state = pending.version, pending.state
+                pending.urgent = False
+                try:
+                    await self.send(pending.target, state)
+                except Exception as e:
+                    self.logger.warning(f"Failed to update message: {e}")
+                pending.lastSent = monotonic()
+                pending.sentVersion = version
+                async with pending.sent:
+                    pending.sent.notify_all()
+        finally:
+            pending.task = None
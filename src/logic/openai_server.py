@@ -1,61 +1,170 @@
+import asyncio
 import json
 import logging
 import os
-from openai import OpenAI
-from time import sleep, time
+import tempfile
+from time import time
 from datetime import datetime
+from typing import Awaitable, Callable, Literal
 
+from logic.checkpoint_store import CheckpointStore
+from logic.container_pool import ContainerPool
+from logic.command_cache import CommandCache
+from logic.context_manager import ConversationContext, TokenCounter
+from logic.docker_backend import DockerBackend
 from logic.docker_server import DockerServer
-from model.openai_tool import OpenAIFunction, OpenAIFunctionParameter, OpenAIFunctionParameterProperty, OpenAITool
+from logic.job_scheduler import JobScheduler
+from logic.output_buffer import OutputCapture, OutputLogStore
+from logic.port_forwarder import PortForwarder
+from logic.report_store import ReportStore
+from logic.resource_monitor import ResourceMonitor
+from logic.tool_executor import ToolCall, ToolExecutor
+from logic.tool_registry import ToolRegistry, tool
+from logic.tracing import tracer
 from model.run_result import RunResult
 
 class OpenAIServer:
-    def __init__(self, token: str, model="gpt-4-1106-preview"):
+    def __init__(
+            self,
+            token: str,
+            model="gpt-4-1106-preview",
+            dockerBackend: str | DockerBackend = "cli",
+            pool: ContainerPool | None = None,
+            cpu: float = 1.0,
+            ram: str = "512mb",
+            swap: str = "512mb",
+            serverID: str = "openai",
+            sequentialTools: bool = False,
+            scheduler: JobScheduler | None = None,
+            sessionKey: str = "",
+            ownerID: int = 0,
+            progressInterval: float = 3.0,
+            contextBudget: int = 12000,
+            extraTools: list[Callable] | None = None,
+            forwarder: PortForwarder | None = None,
+            commandCache: CommandCache | None = None,
+            baseURL: str | None = None,
+            logDir: str | None = None,
+            checkpoints: CheckpointStore | None = None,
+            monitor: ResourceMonitor | None = None
+        ):
         self.model = model
-        self.reports = []
-        self.jobs = {}
-        self.runningLock = False
-        self.server = DockerServer("ubuntu", "openai", 1.0, "512mb", "512mb")
+        self.reports = ReportStore(maxEntries=10)
+        self.outputLogs = OutputLogStore(logDir or os.path.join(tempfile.gettempdir(), "openailinux-logs", serverID))
+        self.scheduler = scheduler
+        self.sessionKey = sessionKey
+        self.ownerID = ownerID
+        self.progressInterval = progressInterval
+        self.onProgress: Callable[[str, str], Awaitable[None]] | None = None
+        self.runningLock = asyncio.Lock()
+        self.server = DockerServer("ubuntu", serverID, cpu, ram, swap, backend=dockerBackend, pool=pool, forwarder=forwarder, commandCache=commandCache, checkpoints=checkpoints, monitor=monitor)
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.level = logging.INFO
-        self.client = OpenAI(api_key=token)
+        self.token = token
+        self.baseURL = baseURL
+        self._client = None
+        self.registry = ToolRegistry.fromInstance(self)
+        for extraTool in extraTools or []:
+            self.registry.register(extraTool)
+        self.toolExecutor = ToolExecutor(self.registry.dispatch, sequential=sequentialTools)
+        self.tokenCounter = TokenCounter(model)
+        self.contextBudget = contextBudget
 
-    def exec_command(self, cmd: str) -> dict[str, any]:
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self.token, base_url=self.baseURL)
+        return self._client
+
+    @tool("Executes the given command. Can check output of up to 500 characters or 5 lines. If the output is longer, the full log can be read with `read_output` using the returned log_id. Keyboard input is not available. Recommended to use `echo` command. Timeout is 10 min. Work folder can be changed with `change_directory` Function.")
+    async def exec_command(self, cmd: str) -> dict[str, any]:
         self.logger.info(f"Executing command: {cmd}")
-        proc = self.server.runCommand(cmd=cmd)
-        output: str = proc.stdout + proc.stderr
-        self.logger.info(f"Executed command: {cmd} (returncode: {proc.returncode})\n{output}")
-        if len(output) > 500:
-            output = output[-500:]
-        outputList = output.split("\n")
-        if len(outputList) > 5:
-            outputList = outputList[-5:]
-        output = "\n".join(outputList)
+        logID, capture = self.outputLogs.create()
+        progressTask = asyncio.create_task(self.reportProgress(cmd, capture)) if self.onProgress is not None else None
+        try:
+            proc = await self.server.runCommandAsync(cmd=cmd, onOutput=capture.write)
+        finally:
+            if progressTask is not None:
+                progressTask.cancel()
+            output = capture.tail(500, 5)
+            kept = await asyncio.to_thread(self.outputLogs.commit, logID, capture, capture.totalBytes > len(output.encode()))
+        self.logger.info(f"Executed command: {cmd} (returncode: {proc.returncode}, {capture.totalBytes} bytes)")
+        self.logger.debug(output)
+        logInfo = {"log_id": logID, "total_bytes": capture.totalBytes} if kept else {}
+        message = self.resourceMessage(proc.returncode)
         if proc.returncode == 124:
-            return RunResult(returncode=124, output="Sorry, timeout").dict()
-        return RunResult(returncode=proc.returncode, output=output).dict()
+            return RunResult(returncode=124, output="Sorry, timeout", message=message, **logInfo).dict(exclude_none=True)
+        return RunResult(returncode=proc.returncode, output=output, message=message, **logInfo).dict(exclude_none=True)
+
+    def resourceMessage(self, returncode: int) -> str | None:
+        notes = []
+        if returncode == 137:
+            notes.append(f"The process was killed (SIGKILL), most likely because it ran out of memory ({self.server.ram.upper()} limit)")
+        pressure = self.server.monitor.pressure(self.server.name) if self.server.monitor is not None else None
+        if pressure is not None:
+            notes.append(f"Resource pressure: {pressure}")
+        return ". ".join(notes) if len(notes) > 0 else None
+
+    @tool(
+        "Read the full output of a previous `exec_command` call, up to 2000 bytes at a time.",
+        log_id="log_id returned by `exec_command`",
+        offset="Byte offset to start reading from. Use next_offset from the previous page."
+    )
+    def read_output(self, log_id: int, offset: int = 0):
+        page = self.outputLogs.read(log_id, offset)
+        if page is None:
+            return {"result": "failed", "message": "unknown or expired log_id"}
+        return {"result": "ok", **page}
     
-    def change_directory(self, path):
+    async def reportProgress(self, cmd: str, buffer: OutputCapture):
+        version = 0
+        while True:
+            await asyncio.sleep(self.progressInterval)
+            if buffer.version == version:
+                continue
+            version = buffer.version
+            try:
+                await self.onProgress(cmd, buffer.tail(1000, 15))
+            except Exception as e:
+                self.logger.warning(f"Failed to report progress: {e}")
+
+    @tool("Change the working directory to the given folder path.")
+    def change_directory(self, path: str):
         res = self.server.changeWorkDir(path)
         self.logger.info(f"Changed directory to {self.server.workDir} (target: {path})")
         return {"result": "ok" if res else "failed"}
     
-    def call_myself(self, unixtime: int, message=""):
+    @tool(
+        "This function will call you again at the given time.",
+        unixtime="I recommend calculating it first using the command.",
+        message="Message for next execution. What you want the next you to do."
+    )
+    async def call_myself(self, unixtime: int, message: str = ""):
         if unixtime < int(time()):
             return {"result": "failed", "message": "Past time specified"}
-        self.jobs[unixtime] = message
+        if self.scheduler is None:
+            return {"result": "failed", "message": "Scheduler is not available"}
+        if not self.scheduler.schedule(self.sessionKey, self.ownerID, unixtime, message):
+            return {"result": "ok", "message": "Already scheduled"}
         self.logger.info(f"Scheduled to call myself at {datetime.fromtimestamp(unixtime).strftime('%Y-%m-%d %H:%M:%S')}")
         return {"result": "ok"}
     
+    @tool(
+        "Once you have completed the instructions, be sure to do it at the end.",
+        description="A short one-sentence explanation of what you did."
+    )
     def write_report(self, description: str):
         self.reports.append(description)
         self.logger.info(f"Wrote report: {description}")
         return {"result": "ok"}
     
-    def write_file(self, path: str, value: str, mode: str):
+    @tool("Creating or appending a text file", value="Only text available")
+    def write_file(self, path: str, value: str, mode: Literal["create", "append"]):
         self.logger.info(f"Writing file: {path}")
         return {"result": "ok" if self.server.writeTextFile(path, value, mode) else "failed"}
     
+    @tool("Open a port for the user. Open ports for external IP only. Don't limit your listening address to localhost")
     def open_port(self, port: int):
         self.logger.info(f"Opening port: {port}")
         message = ""
@@ -65,198 +174,127 @@ class OpenAIServer:
             message = "" if self.server.openPort(port) else "already opened"
         return {"result": "ok" if message == "" else "failed", "message": message}
     
+    @tool("Close the ports you opened for the user")
     def close_port(self, port: int):
         self.logger.info(f"Closing port: {port}")
         message = "" if self.server.closePort(port) else "already closed"
         return {"result": "ok" if message == "" else "failed", "message": message}
     
+    @tool("Reset the server. All files will be deleted.")
     def reset_all(self):
         self.logger.info("Resetting server")
-        self.server.stop()
-        self.server.start()
-        self.server.ports = []
+        self.server.reset()
+        return {"result": "ok"}
+
+    @tool("List the checkpoints of the server. A checkpoint is taken automatically before each request if files have changed.")
+    def list_checkpoints(self):
+        if self.server.checkpoints is None:
+            return {"result": "failed", "message": "Checkpoints are not available"}
+        return {"result": "ok", "checkpoints": [{
+            "checkpoint_id": checkpoint.id,
+            "label": checkpoint.label,
+            "created_at": datetime.fromtimestamp(checkpoint.createdAt).strftime('%Y-%m-%d %H:%M:%S'),
+            "work_dir": checkpoint.workDir
+        } for checkpoint in self.server.checkpoints.list(self.server.name)]}
+
+    @tool(
+        "Restore the files of the server to a checkpoint. Running processes are not restored and must be started again.",
+        checkpoint_id="checkpoint_id returned by `list_checkpoints`"
+    )
+    def restore_checkpoint(self, checkpoint_id: int):
+        self.logger.info(f"Restoring checkpoint: {checkpoint_id}")
+        if self.server.checkpoints is None:
+            return {"result": "failed", "message": "Checkpoints are not available"}
+        if not self.server.restore(checkpoint_id):
+            return {"result": "failed", "message": "unknown checkpoint_id"}
         return {"result": "ok"}
     
     @staticmethod
-    def generateTools() -> list[dict]:
-        tools = [
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="exec_command",
-                    description="Executes the given command. Can check output of up to 500 characters or 5 lines. Keyboard input is not available. Recommended to use `echo` command. Timeout is 10 min. Work folder can be changed with `change_directory` Function.",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "cmd": OpenAIFunctionParameterProperty(
-                                type="string"
-                            )
-                        },
-                        required=["cmd"]
-                    ),
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="change_directory",
-                    description="Change the working directory to the given folder path.",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "path": OpenAIFunctionParameterProperty(
-                                type="string"
-                            )
-                        },
-                        required=["path"]
-                    ),
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="call_myself",
-                    description="This function will call you again at the given time.",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "unixtime": OpenAIFunctionParameterProperty(
-                                type="integer",
-                                description="I recommend calculating it first using the command."
-                            ),
-                            "message": OpenAIFunctionParameterProperty(
-                                type="string",
-                                description="Message for next execution. What you want the next you to do."
-                            )
-                        },
-                        required=["unixtime"]
-                    ),
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="write_report",
-                    description="Once you have completed the instructions, be sure to do it at the end.",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "description": OpenAIFunctionParameterProperty(
-                                type="string",
-                                description="A short one-sentence explanation of what you did."
-                            )
-                        },
-                        required=["description"]
-                    ),
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="write_file",
-                    description="Creating or appending a text file",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "path": OpenAIFunctionParameterProperty(
-                                type="string"
-                            ),
-                            "value": OpenAIFunctionParameterProperty(
-                                type="string",
-                                description="Only text available"
-                            ),
-                            "mode": OpenAIFunctionParameterProperty(
-                                type="string",
-                                enum=["create", "append"]
-                            )
-                        },
-                        required=["path", "value", "mode"]
-                    )
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="open_port",
-                    description="Open a port for the user. Open ports for external IP only. Don't limit your listening address to localhost",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "port": OpenAIFunctionParameterProperty(
-                                type="integer",
-                            )
-                        },
-                        required=["port"]
-                    ),
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="close_port",
-                    description="Close the ports you opened for the user",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                            "port": OpenAIFunctionParameterProperty(
-                                type="integer",
-                            )
-                        },
-                        required=["port"]
-                    ),
-                )
-            ),
-            OpenAITool(
-                function=OpenAIFunction(
-                    name="reset_all",
-                    description="Reset the server. All files will be deleted.",
-                    parameters=OpenAIFunctionParameter(
-                        properties={
-                        },
-                        required=[]
-                    ),
-                )
-            )
-        ]
-        tools = [tool.dict() for tool in tools]
-        for tool in tools:
-            for key in tool["function"]["parameters"]["properties"].keys():
-                if tool["function"]["parameters"]["properties"][key]["description"] is None:
-                    tool["function"]["parameters"]["properties"][key].pop("description")
-                if tool["function"]["parameters"]["properties"][key]["enum"] is None:
-                    tool["function"]["parameters"]["properties"][key].pop("enum")
-        return tools
-    
-    async def run(self, prompt: str, attachmentPath: str | None = None):
-        while self.runningLock:
-            sleep(1)
+    def parseArguments(arguments: str) -> dict | None:
         try:
-            self.runningLock = True
-            pastActionsPrompt = "" if len(self.reports) > 0 else "N/A"
-            if len(self.reports) > 0:
-                if len(self.reports) > 10:
-                    self.reports = self.reports[-10:]
-                for report in self.reports:
-                    pastActionsPrompt += f"- {report}\n"
-            portsPrompt = "" if len(self.server.ports) > 0 else "N/A"
-            if len(self.server.ports) > 0:
-                for port in self.server.ports:
-                    portsPrompt += f"{port},"
-            systemPrompt = f"You are the administrator of a Ubuntu server.\n\nServer specs:\nCPU: {self.server.cpu}\nRAM: {self.server.ram.upper()}\nSwap: {self.server.swap.upper()}\nUser: root\n\nUse functions to respond to requests from users.\nBelow is a summary of the actions you have taken in the past.\n{pastActionsPrompt}\n\nPorts open to the user: {portsPrompt}\nYour server is running on Docker. Systemd is not available. If you want to execute in the background, please use `nohup`.\n"
-            if attachmentPath is not None:
-                systemPrompt += f"\nFiles attached to the message are stored in `{attachmentPath}`.\n"
-            messages = [{"role": "system", "content": systemPrompt}, {"role": "user", "content": f"Here's a request from a user: {prompt}"}]
-            while True:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    tools=self.generateTools(),
-                    tool_choice="auto"
-                )
+            return json.loads(arguments)
+        except ValueError:
+            return None
+
+    async def run(
+            self,
+            prompt: str,
+            attachmentPath: str | None = None,
+            isScheduled: bool = False,
+            onProgress: Callable[[str, str], Awaitable[None]] | None = None
+        ):
+        async with self.runningLock:
+            await self.process(prompt, attachmentPath=attachmentPath, isScheduled=isScheduled, onProgress=onProgress)
+
+    async def process(
+            self,
+            prompt: str,
+            attachmentPath: str | None = None,
+            isScheduled: bool = False,
+            onProgress: Callable[[str, str], Awaitable[None]] | None = None
+        ):
+        self.onProgress = onProgress
+        try:
+            async with tracer.span("run", "scheduled" if isScheduled else "message", sessionKey=self.sessionKey):
+                await asyncio.to_thread(self.server.checkpoint, prompt.splitlines()[0][:100] if prompt.strip() != "" else "(empty)")
+                await self.converse(prompt, attachmentPath=attachmentPath, isScheduled=isScheduled)
+        finally:
+            self.onProgress = None
+
+    async def converse(self, prompt: str, attachmentPath: str | None = None, isScheduled: bool = False):
+        portsPrompt = "" if len(self.server.ports) > 0 else "N/A"
+        if len(self.server.ports) > 0:
+            for port, mappedPort in self.server.ports.items():
+                portsPrompt += f"{port} (host port {mappedPort}),"
+        systemPrompt = f"You are the administrator of a Ubuntu server.\n\nServer specs:\nCPU: {self.server.cpu}\nRAM: {self.server.ram.upper()}\nSwap: {self.server.swap.upper()}\nUser: root\n\nUse functions to respond to requests from users.\nYour server is running on Docker. Systemd is not available. If you want to execute in the background, please use `nohup`.\n"
+        contextPrompt = f"Below is a summary of the actions you have taken in the past.\n{self.reports.prompt()}\n\nPorts open to the user: {portsPrompt}\n"
+        pressure = self.server.monitor.pressure(self.server.name) if self.server.monitor is not None else None
+        if pressure is not None:
+            contextPrompt += f"\nResource pressure on your server: {pressure}\n"
+        if attachmentPath is not None:
+            contextPrompt += f"\nFiles attached to the message are stored in `{attachmentPath}`.\n"
+        userPrompt = f"You scheduled this call with `call_myself`. Messages from your past self:\n{prompt}" if isScheduled else f"Here's a request from a user: {prompt}"
+        context = ConversationContext(self.tokenCounter, budget=self.contextBudget)
+        context.append({"role": "system", "content": systemPrompt})
+        context.append({"role": "user", "content": f"{contextPrompt}\n{userPrompt}"})
+        turn = 0
+        while True:
+            turn += 1
+            async with tracer.span("turn", index=turn, sessionKey=self.sessionKey):
+                context.compact()
+                async with tracer.span("completion", self.model, messages=len(context.messages)) as span:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=context.messages,
+                        tools=self.registry.schema(),
+                        tool_choice="auto"
+                    )
+                    if response.usage is not None:
+                        span.set(promptTokens=response.usage.prompt_tokens, completionTokens=response.usage.completion_tokens)
+                        tracer.count("tokens_total", response.usage.prompt_tokens, kind="prompt", model=self.model)
+                        tracer.count("tokens_total", response.usage.completion_tokens, kind="completion", model=self.model)
                 response_message = response.choices[0].message
-                messages.append(response_message)
                 tool_calls = response_message.tool_calls
+                assistantMessage = {"role": "assistant", "content": response_message.content}
+                if tool_calls:
+                    assistantMessage["tool_calls"] = [{
+                        "id": tool_call.id,
+                        "type": "function",
+                        "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                    } for tool_call in tool_calls]
+                context.append(assistantMessage)
                 shouldExit = False
                 if tool_calls:
-                    for tool_call in tool_calls:
-                        func = getattr(self, tool_call.function.name)
-                        shouldExit = tool_call.function.name == "write_report"
-                        if callable(func):
-                            functionResponse: str = json.dumps(func(**json.loads(tool_call.function.arguments)))
-                            messages.append({
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": tool_call.function.name,
-                                "content": functionResponse
-                            })
+                    calls = [ToolCall(tool_call.id, tool_call.function.name, self.parseArguments(tool_call.function.arguments)) for tool_call in tool_calls]
+                    shouldExit = calls[-1].name == "write_report"
+                    results = await self.toolExecutor.execute(calls)
+                    for call, result in zip(calls, results):
+                        context.append({
+                            "tool_call_id": call.id,
+                            "role": "tool",
+                            "name": call.name,
+                            "content": json.dumps(result)
+                        })
                 else:
-                    messages.append({"role": "user", "content": "Sorry, User cannot reply to you. Please use tools. If you want to exit, please use \"write_report\" function."})
-                if shouldExit: break
-        finally:
-            self.runningLock = False
\ No newline at end of file
+                    context.append({"role": "user", "content": "Sorry, User cannot reply to you. Please use tools. If you want to exit, please use \"write_report\" function."})
+            if shouldExit: break
\ No newline at end of file
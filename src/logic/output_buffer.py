@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict
+
+OUTPUT_LIMIT = 1024 * 1024
+
+def leadingContinuation(data: bytes | bytearray) -> int:
+    count = 0
+    while count < min(3, len(data)) and data[count] & 0xC0 == 0x80:
+        count += 1
+    return count
+
+def completeLength(data: bytes | bytearray) -> int:
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte & 0x80 == 0:
+            return len(data)
+        width = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4 if byte & 0xF8 == 0xF0 else 1
+        return len(data) if back >= width else len(data) - back
+    return len(data)
+
+def decodeTail(data: bytes | bytearray, truncated: bool) -> str:
+    start = leadingContinuation(data) if truncated else 0
+    return bytes(data[start:]).decode(errors="replace")
+
+class TailBuffer:
+    def __init__(self, maxBytes: int = 65536):
+        self.maxBytes = maxBytes
+        self.data = bytearray()
+        self.start = 0
+        self.totalBytes = 0
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def write(self, chunk: bytes):
+        chunk = memoryview(chunk)
+        with self.lock:
+            self.totalBytes += len(chunk)
+            self.version += 1
+            if len(chunk) >= self.maxBytes:
+                self.data = bytearray(chunk[len(chunk) - self.maxBytes:])
+                self.start = 0
+                return
+            if len(self.data) < self.maxBytes:
+                room = self.maxBytes - len(self.data)
+                self.data += chunk[:room]
+                chunk = chunk[room:]
+                if len(chunk) == 0:
+                    return
+            end = self.start + len(chunk)
+            if end <= self.maxBytes:
+                self.data[self.start:end] = chunk
+            else:
+                split = self.maxBytes - self.start
+                self.data[self.start:] = chunk[:split]
+                self.data[:len(chunk) - split] = chunk[split:]
+            self.start = end % self.maxBytes
+
+    def snapshot(self, maxBytes: int | None = None) -> bytes:
+        with self.lock:
+            data = bytes(self.data[self.start:] + self.data[:self.start]) if self.start > 0 else bytes(self.data)
+        if maxBytes is not None and len(data) > maxBytes:
+            return data[-maxBytes:]
+        return data
+
+    def text(self) -> str:
+        data = self.snapshot()
+        return decodeTail(data, self.totalBytes > len(data))
+
+    def tail(self, maxChars: int, maxLines: int) -> str:
+        data = self.snapshot(maxChars * 4)
+        output = decodeTail(data, self.totalBytes > len(data))
+        if len(output) > maxChars:
+            output = output[-maxChars:]
+        outputList = output.split("\n")
+        if len(outputList) > maxLines:
+            outputList = outputList[-maxLines:]
+        return "\n".join(outputList)
+
+class OutputCapture:
+    def __init__(self, path: str | None = None, maxBytes: int = 65536, spillThreshold: int = 4096, maxSpillBytes: int = 256 * 1024 * 1024):
+        self.buffer = TailBuffer(maxBytes)
+        self.path = path
+        self.spillThreshold = spillThreshold
+        self.maxSpillBytes = maxSpillBytes
+        self.head = bytearray()
+        self.file = None
+        self.spilledBytes = 0
+        self.truncated = False
+
+    @property
+    def totalBytes(self) -> int:
+        return self.buffer.totalBytes
+
+    @property
+    def version(self) -> int:
+        return self.buffer.version
+
+    def text(self) -> str:
+        return self.buffer.text()
+
+    def tail(self, maxChars: int, maxLines: int) -> str:
+        return self.buffer.tail(maxChars, maxLines)
+
+    def write(self, chunk: bytes):
+        self.buffer.write(chunk)
+        if self.path is None:
+            return
+        if self.file is None:
+            if len(self.head) + len(chunk) <= self.spillThreshold:
+                self.head += chunk
+                return
+            self.spill()
+        self.writeFile(chunk)
+
+    def spill(self):
+        self.file = open(self.path, "wb")
+        head, self.head = self.head, bytearray()
+        self.writeFile(head)
+
+    def writeFile(self, chunk: bytes):
+        room = self.maxSpillBytes - self.spilledBytes
+        if len(chunk) > room:
+            chunk = chunk[:max(0, room)]
+            self.truncated = True
+        if len(chunk) > 0:
+            self.file.write(chunk)
+            self.spilledBytes += len(chunk)
+
+    def close(self, keep: bool) -> bool:
+        if self.path is None:
+            return False
+        if keep and self.file is None:
+            self.spill()
+        self.head = bytearray()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            if not keep:
+                os.remove(self.path)
+        return keep
+
+class OutputLogStore:
+    def __init__(self, directory: str, maxLogs: int = 10, pageBytes: int = 2000):
+        self.directory = directory
+        self.maxLogs = maxLogs
+        self.pageBytes = pageBytes
+        self.nextID = 1
+        self.logs: OrderedDict[int, OutputCapture] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, logID: int) -> str:
+        return os.path.join(self.directory, f"{logID}.log")
+
+    def create(self, **kwargs) -> tuple[int, OutputCapture]:
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            logID = self.nextID
+            self.nextID += 1
+        return logID, OutputCapture(self.path(logID), **kwargs)
+
+    def commit(self, logID: int, capture: OutputCapture, keep: bool) -> bool:
+        if not capture.close(keep):
+            return False
+        with self.lock:
+            self.logs[logID] = capture
+            while len(self.logs) > self.maxLogs:
+                oldID, _ = self.logs.popitem(last=False)
+                try:
+                    os.remove(self.path(oldID))
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def read(self, logID: int, offset: int = 0) -> dict | None:
+        with self.lock:
+            capture = self.logs.get(logID)
+        if capture is None:
+            return None
+        try:
+            with open(self.path(logID), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                offset = min(max(0, offset), size)
+                f.seek(offset)
+                data = f.read(self.pageBytes + 3)
+        except FileNotFoundError:
+            return None
+        if offset > 0:
+            skip = leadingContinuation(data)
+            offset += skip
+            data = data[skip:]
+        if len(data) > self.pageBytes:
+            data = data[:self.pageBytes]
+            data = data[:completeLength(data)] or data
+        nextOffset = offset + len(data)
+        page = {
+            "output": data.decode(errors="replace"),
+            "offset": offset,
+            "next_offset": nextOffset if nextOffset < size else None,
+            "total_bytes": capture.totalBytes
+        }
+        if capture.truncated:
+            page["stored_bytes"] = size
+        return page
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import threading
+from time import monotonic
+
+class PortStats:
+    def __init__(self):
+        self.connections = 0
+        self.active = 0
+        self.rejected = 0
+        self.failed = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+
+class Forward:
+    def __init__(self, listenPort: int, targetHost: str, targetPort: int):
+        self.listenPort = listenPort
+        self.targetHost = targetHost
+        self.targetPort = targetPort
+        self.stats = PortStats()
+        self.server: asyncio.Server | None = None
+        self.writers: set[asyncio.StreamWriter] = set()
+
+class PortAllocator:
+    def __init__(self, start: int = 30000, end: int = 39999):
+        self.start = start
+        self.end = end
+        self.used: set[int] = set()
+        self.lock = threading.Lock()
+
+    def candidates(self, port: int):
+        size = self.end - self.start + 1
+        preferred = self.start + port % size
+        for offset in range(size):
+            yield self.start + (preferred - self.start + offset) % size
+
+    def allocate(self, port: int) -> int | None:
+        with self.lock:
+            for candidate in self.candidates(port):
+                if candidate not in self.used:
+                    self.used.add(candidate)
+                    return candidate
+        return None
+
+    def release(self, port: int):
+        with self.lock:
+            self.used.discard(port)
+
+class PortForwarder:
+    def __init__(
+            self,
+            host: str = "0.0.0.0",
+            allocator: PortAllocator | None = None,
+            maxConnections: int = 64,
+            idleTimeout: float = 300,
+            connectTimeout: float = 10,
+            bufferSize: int = 65536
+        ):
+        self.host = host
+        self.allocator = allocator or PortAllocator()
+        self.maxConnections = maxConnections
+        self.idleTimeout = idleTimeout
+        self.connectTimeout = connectTimeout
+        self.bufferSize = bufferSize
+        self.forwards: dict[int, Forward] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread: threading.Thread | None = None
+        self.startLock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def ensureStarted(self) -> asyncio.AbstractEventLoop:
+        with self.startLock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="PortForwarder", daemon=True)
+                self.thread.start()
+        return self.loop
+
+    def call(self, coro, timeout: float = 30):
+        return asyncio.run_coroutine_threadsafe(coro, self.ensureStarted()).result(timeout)
+
+    def open(self, targetHost: str, targetPort: int) -> int | None:
+        return self.call(self.openAsync(targetHost, targetPort))
+
+    def close(self, listenPort: int) -> bool:
+        if self.loop is None:
+            return False
+        return self.call(self.closeAsync(listenPort))
+
+    def stats(self, listenPort: int) -> PortStats | None:
+        forward = self.forwards.get(listenPort)
+        return forward.stats if forward is not None else None
+
+    def shutdown(self):
+        if self.loop is None:
+            return
+        for listenPort in list(self.forwards):
+            self.close(listenPort)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+        self.loop = None
+
+    async def openAsync(self, targetHost: str, targetPort: int) -> int | None:
+        rejected = []
+        try:
+            while (listenPort := self.allocator.allocate(targetPort)) is not None:
+                forward = Forward(listenPort, targetHost, targetPort)
+                try:
+                    forward.server = await asyncio.start_server(
+                        lambda reader, writer, forward=forward: self.handle(forward, reader, writer),
+                        self.host,
+                        listenPort,
+                        reuse_address=True
+                    )
+                except OSError as e:
+                    self.logger.warning(f"Port {listenPort} is unavailable: {e}")
+                    rejected.append(listenPort)
+                    continue
+                self.forwards[listenPort] = forward
+                self.logger.info(f"Forwarding {self.host}:{listenPort} to {targetHost}:{targetPort}")
+                return listenPort
+        finally:
+            for port in rejected:
+                self.allocator.release(port)
+        self.logger.error(f"No free port to forward {targetHost}:{targetPort}")
+        return None
+
+    async def closeAsync(self, listenPort: int) -> bool:
+        forward = self.forwards.pop(listenPort, None)
+        if forward is None:
+            return False
+        forward.server.close()
+        for writer in list(forward.writers):
+            writer.close()
+        await forward.server.wait_closed()
+        self.allocator.release(listenPort)
+        self.logger.info(f"Closed forward {self.host}:{listenPort}")
+        return True
+
+    async def handle(self, forward: Forward, clientReader: asyncio.StreamReader, clientWriter: asyncio.StreamWriter):
+        stats = forward.stats
+        if stats.active >= self.maxConnections:
+            stats.rejected += 1
+            clientWriter.close()
+            return
+        stats.active += 1
+        stats.connections += 1
+        forward.writers.add(clientWriter)
+        upstreamWriter = None
+        try:
+            try:
+                upstreamReader, upstreamWriter = await asyncio.wait_for(
+                    asyncio.open_connection(forward.targetHost, forward.targetPort),
+                    self.connectTimeout
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                stats.failed += 1
+                self.logger.warning(f"Failed to connect to {forward.targetHost}:{forward.targetPort}: {e}")
+                return
+            forward.writers.add(upstreamWriter)
+            lastActive = [monotonic()]
+            pending = {
+                asyncio.create_task(self.pipe(clientReader, upstreamWriter, stats, "bytesIn", lastActive)),
+                asyncio.create_task(self.pipe(upstreamReader, clientWriter, stats, "bytesOut", lastActive))
+            }
+            while pending:
+                _, pending = await asyncio.wait(pending, timeout=max(0, lastActive[0] + self.idleTimeout - monotonic()))
+                if pending and monotonic() - lastActive[0] >= self.idleTimeout:
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    break
+        finally:
+            stats.active -= 1
+            for writer in (clientWriter, upstreamWriter):
+                if writer is not None:
+                    forward.writers.discard(writer)
+                    writer.close()
+
+    async def pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, stats: PortStats, counter: str, lastActive: list[float]):
+        try:
+            while data := await reader.read(self.bufferSize):
+                writer.write(data)
+                await writer.drain()
+                setattr(stats, counter, getattr(stats, counter) + len(data))
+                lastActive[0] = monotonic()
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            writer.close()
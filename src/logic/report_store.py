@@ -0,0 +1,30 @@
+from collections import deque
+
+class ReportStore:
+    def __init__(self, maxEntries: int = 10, maxChars: int = 2000):
+        self.maxEntries = maxEntries
+        self.maxChars = maxChars
+        self.entries: deque[str] = deque(maxlen=maxEntries)
+        self.chars = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def append(self, report: str):
+        if len(self.entries) == self.maxEntries:
+            self.chars -= len(self.entries[0])
+        self.entries.append(report)
+        self.chars += len(report)
+        while self.chars > self.maxChars and len(self.entries) > 1:
+            self.chars -= len(self.entries.popleft())
+
+    def latest(self) -> str | None:
+        return self.entries[-1] if len(self.entries) > 0 else None
+
+    def prompt(self) -> str:
+        if len(self.entries) == 0:
+            return "N/A"
+        return "".join(f"- {report}\n" for report in self.entries)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from logic.docker_backend import ContainerStats, DockerBackend, formatSize, parseSize
+
+if TYPE_CHECKING:
+    from logic.docker_server import DockerServer
+
+class HostSaturatedError(Exception):
+    pass
+
+class ContainerUsage:
+    def __init__(self, server: "DockerServer", window: int):
+        self.server = server
+        self.samples: deque[ContainerStats] = deque(maxlen=window)
+
+class ResourceMonitor:
+    def __init__(
+            self,
+            backend: DockerBackend,
+            interval: float = 10.0,
+            window: int = 6,
+            maxCPU: float | None = None,
+            maxRAM: str | None = None,
+            growAt: float = 0.8,
+            shrinkAt: float = 0.3,
+            maxLoad: float = 1.5,
+            minFreeMemory: float = 0.1
+        ):
+        self.backend = backend
+        self.interval = interval
+        self.window = window
+        self.maxCPU = maxCPU
+        self.maxRAM = parseSize(maxRAM) if maxRAM is not None else None
+        self.growAt = growAt
+        self.shrinkAt = shrinkAt
+        self.maxLoad = maxLoad
+        self.minFreeMemory = minFreeMemory
+        self.containers: dict[str, ContainerUsage] = {}
+        self.hostReason: str | None = None
+        self.resizes = 0
+        self.stopEvent = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 5)
+            self.thread = None
+
+    def register(self, server: "DockerServer"):
+        with self.lock:
+            self.containers[server.name] = ContainerUsage(server, self.window)
+
+    def unregister(self, name: str):
+        with self.lock:
+            self.containers.pop(name, None)
+
+    def loop(self):
+        while not self.stopEvent.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.warning(f"Failed to sample resource usage: {e}")
+            self.stopEvent.wait(self.interval)
+
+    def sample(self):
+        self.hostReason = self.hostPressure()
+        with self.lock:
+            usages = dict(self.containers)
+        stats = self.backend.containerStats(list(usages))
+        for name, usage in usages.items():
+            if name in stats:
+                usage.samples.append(stats[name])
+                self.adapt(usage)
+
+    @staticmethod
+    def readMeminfo() -> dict[str, int]:
+        meminfo = {}
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    meminfo[key] = int(value.split()[0]) * 1024
+        except (OSError, ValueError, IndexError):
+            return {}
+        return meminfo
+
+    def hostPressure(self) -> str | None:
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            load = 0.0
+        if load > self.maxLoad:
+            return f"load average is {load:.2f} per CPU"
+        meminfo = self.readMeminfo()
+        if meminfo.get("MemTotal", 0) > 0 and "MemAvailable" in meminfo:
+            available = meminfo["MemAvailable"] / meminfo["MemTotal"]
+            if available < self.minFreeMemory:
+                return f"only {available * 100:.0f}% of host memory is available"
+        return None
+
+    def adapt(self, usage: ContainerUsage):
+        if len(usage.samples) < self.window:
+            return
+        server = usage.server
+        baseCPU, baseRAM, _ = server.baseLimits
+        ram = parseSize(server.ram)
+        cpuLoad = sum(sample.cpuPercent for sample in usage.samples) / len(usage.samples) / (server.cpu * 100)
+        memoryLoad = sum(sample.memoryPercent for sample in usage.samples) / len(usage.samples) / 100
+        cpu, newRAM = server.cpu, ram
+        if self.hostReason is None:
+            if self.maxRAM is not None and memoryLoad > self.growAt and ram < self.maxRAM:
+                newRAM = min(self.maxRAM, ram * 2)
+            if self.maxCPU is not None and cpuLoad > self.growAt and cpu < self.maxCPU:
+                cpu = min(self.maxCPU, cpu + 1)
+        if memoryLoad < self.shrinkAt and ram > parseSize(baseRAM):
+            newRAM = max(parseSize(baseRAM), ram // 2)
+        if cpuLoad < self.shrinkAt and cpu > baseCPU:
+            cpu = max(baseCPU, cpu - 1)
+        if (cpu, newRAM) == (server.cpu, ram):
+            return
+        swap = parseSize(server.swap) - ram + newRAM
+        if server.resize(cpu, formatSize(newRAM), formatSize(swap)):
+            usage.samples.clear()
+            self.resizes += 1
+
+    def latest(self, name: str) -> ContainerStats | None:
+        usage = self.containers.get(name)
+        if usage is None or len(usage.samples) == 0:
+            return None
+        return usage.samples[-1]
+
+    def pressure(self, name: str) -> str | None:
+        usage = self.containers.get(name)
+        stats = self.latest(name)
+        if usage is None or stats is None:
+            return None
+        notes = []
+        if stats.memoryPercent >= 90:
+            notes.append(f"memory is at {stats.memoryPercent:.0f}% of the {formatSize(stats.memoryLimit).upper()} limit, processes may be killed when it runs out")
+        if stats.cpuPercent >= 90 * usage.server.cpu:
+            notes.append(f"CPU is saturated ({stats.cpuPercent:.0f}% of {usage.server.cpu} cores)")
+        return "; ".join(notes) if len(notes) > 0 else None
+
+    async def admit(self, timeout: float):
+        deadline = monotonic() + timeout
+        while (reason := self.hostReason) is not None:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise HostSaturatedError(f"Host is saturated: {reason}")
+            self.logger.info(f"Waiting for host capacity: {reason}")
+            await asyncio.sleep(min(self.interval, remaining))
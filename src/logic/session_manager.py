@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import AsyncIterator, Callable
+
+from logic.job_scheduler import JobScheduler
+from logic.openai_server import OpenAIServer
+from logic.resource_monitor import ResourceMonitor
+
+class Session:
+    def __init__(self, key: str, openAI: OpenAIServer):
+        self.key = key
+        self.openAI = openAI
+        self.active = 0
+        self.lastUsed = monotonic()
+        self.starting: asyncio.Task | None = None
+
+class SessionManager:
+    def __init__(
+            self,
+            factory: Callable[[str, int], OpenAIServer],
+            maxSessions: int = 4,
+            maxConcurrency: int = 2,
+            idleTimeout: float | None = None,
+            monitor: ResourceMonitor | None = None,
+            admissionTimeout: float = 300,
+            scheduler: JobScheduler | None = None
+        ):
+        self.factory = factory
+        self.maxSessions = max(1, maxSessions)
+        self.maxConcurrency = max(1, min(maxConcurrency, self.maxSessions))
+        self.idleTimeout = idleTimeout
+        self.monitor = monitor
+        self.admissionTimeout = admissionTimeout
+        self.scheduler = scheduler
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.semaphore = asyncio.Semaphore(self.maxConcurrency)
+        self.userLocks: dict[int, asyncio.Lock] = {}
+        self.stopping: dict[str, asyncio.Task] = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sessions
+
+    def userLock(self, userID: int) -> asyncio.Lock:
+        if userID not in self.userLocks:
+            self.userLocks[userID] = asyncio.Lock()
+        return self.userLocks[userID]
+
+    async def getSession(self, key: str, userID: int) -> Session:
+        # Bookkeeping happens without awaiting, so the session table never
+        # waits on docker: containers boot and stop in tasks, and callers for
+        # a session that is still booting wait on its start task.
+        self.evictExpired()
+        session = self.sessions.get(key)
+        if session is not None:
+            self.sessions.move_to_end(key)
+        else:
+            while len(self.sessions) >= self.maxSessions:
+                if not self.evictLeastRecentlyUsed():
+                    break
+            session = Session(key, self.factory(key, userID))
+            session.starting = asyncio.create_task(self.boot(session))
+            self.sessions[key] = session
+        session.active += 1
+        try:
+            await asyncio.shield(session.starting)
+        except BaseException:
+            session.active -= 1
+            raise
+        return session
+
+    async def boot(self, session: Session):
+        stopping = self.stopping.get(session.key)
+        if stopping is not None:
+            await asyncio.shield(stopping)
+        try:
+            await asyncio.to_thread(session.openAI.server.start)
+        except Exception:
+            if self.sessions.get(session.key) is session:
+                del self.sessions[session.key]
+            raise
+        self.logger.info(f"Created session {session.key} ({len(self.sessions)}/{self.maxSessions})")
+
+    def hasScheduledJobs(self, key: str) -> bool:
+        return self.scheduler is not None and self.scheduler.hasPending(key)
+
+    def evictLeastRecentlyUsed(self) -> bool:
+        idle = [key for key, session in self.sessions.items() if session.active == 0]
+        if len(idle) == 0:
+            return False
+        self.evict(next((key for key in idle if not self.hasScheduledJobs(key)), idle[0]))
+        return True
+
+    def evictExpired(self):
+        if self.idleTimeout is None:
+            return
+        now = monotonic()
+        expired = [
+            key for key, session in self.sessions.items()
+            if session.active == 0 and now - session.lastUsed > self.idleTimeout and not self.hasScheduledJobs(key)
+        ]
+        for key in expired:
+            self.evict(key)
+
+    def evict(self, key: str):
+        session = self.sessions.pop(key)
+        self.logger.info(f"Evicting session {key}")
+        task = asyncio.create_task(self.shutdown(session, self.stopping.get(key)))
+        self.stopping[key] = task
+        task.add_done_callback(lambda _: self.stopping.pop(key) if self.stopping.get(key) is task else None)
+
+    async def shutdown(self, session: Session, previous: asyncio.Task | None):
+        if previous is not None:
+            await asyncio.shield(previous)
+        try:
+            await asyncio.to_thread(session.openAI.server.stop)
+        except Exception as e:
+            self.logger.error(f"Failed to stop session {session.key}: {e}")
+
+    @asynccontextmanager
+    async def acquire(self, userID: int, key: str) -> AsyncIterator[OpenAIServer]:
+        async with self.userLock(userID):
+            if self.monitor is not None:
+                await self.monitor.admit(self.admissionTimeout)
+            async with self.semaphore:
+                session = await self.getSession(key, userID)
+                try:
+                    async with session.openAI.runningLock:
+                        yield session.openAI
+                finally:
+                    session.active -= 1
+                    session.lastUsed = monotonic()
+
+    def closeAll(self):
+        for session in self.sessions.values():
+            session.openAI.server.stop()
+        self.sessions.clear()
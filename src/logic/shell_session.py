@@ -0,0 +1,190 @@
+import logging
+import re
+import shlex
+import subprocess
+import threading
+from time import monotonic
+from typing import Callable
+from uuid import uuid4
+
+from logic.docker_api import DockerAPIError
+from logic.docker_backend import DockerBackend, ShellChannel
+from logic.output_buffer import OUTPUT_LIMIT, TailBuffer
+
+class MarkerScanner:
+    def __init__(self, pattern: re.Pattern, marker: bytes):
+        self.pattern = pattern
+        self.marker = marker
+        self.pending = bytearray()
+        self.matched = False
+        self.groups: tuple[bytes, ...] = ()
+
+    def feed(self, chunk: bytes) -> bytes:
+        self.pending += chunk
+        match = self.pattern.search(self.pending)
+        if match is not None:
+            self.matched = True
+            self.groups = match.groups()
+            data = bytes(self.pending[:match.start()])
+            self.pending.clear()
+            return data
+        cut = self.safeLength()
+        data = bytes(self.pending[:cut])
+        del self.pending[:cut]
+        return data
+
+    def safeLength(self) -> int:
+        index = self.pending.find(self.marker)
+        if index >= 0:
+            return index
+        for length in range(min(len(self.marker) - 1, len(self.pending)), 0, -1):
+            if self.marker.startswith(self.pending[-length:]):
+                return len(self.pending) - length
+        return len(self.pending)
+
+    def flush(self) -> bytes:
+        data = bytes(self.pending)
+        self.pending.clear()
+        return data
+
+class ShellSession:
+    def __init__(self, containerName: str, backend: DockerBackend, timeout: int = 600, maxOutputBytes: int = OUTPUT_LIMIT):
+        self.containerName = containerName
+        self.backend = backend
+        self.timeout = timeout
+        self.maxOutputBytes = maxOutputBytes
+        self.marker = f"__OPENAILINUX_{uuid4().hex}__"
+        self.channel: ShellChannel | None = None
+        self.shellPID: int | None = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__ + "-" + self.containerName)
+        self.logger.level = logging.INFO
+        self.stdoutPattern = re.compile(re.escape(self.marker.encode()) + rb" (\d+)\n")
+        self.stderrPattern = re.compile(re.escape(self.marker.encode()) + rb"\n")
+
+    def isAlive(self) -> bool:
+        return self.channel is not None and self.channel.isAlive()
+
+    @staticmethod
+    def startsBackgroundJob(cmd: str) -> bool:
+        # Jobs left running by the persistent shell would be its children and
+        # keep the framed stdout pipe open, so a later timeout would kill them
+        # and their output would leak into the next command. Such commands go
+        # through the per-call exec path instead.
+        lexer = shlex.shlex(cmd, posix=False, punctuation_chars=True)
+        lexer.whitespace_split = True
+        try:
+            tokens = list(lexer)
+        except ValueError:
+            return True
+        return any(token in ("&", "coproc", "disown") for token in tokens)
+
+    def start(self) -> bool:
+        self.close()
+        try:
+            self.channel = self.backend.openShell(self.containerName)
+            result = self.execute("echo $$", workDir="/", timeout=10)
+        except (OSError, TimeoutError, DockerAPIError) as e:
+            self.logger.warning(f"Failed to start shell session: {e}")
+            self.close()
+            return False
+        if result.returncode != 0 or not result.stdout.strip().isdigit():
+            self.logger.warning("Failed to start shell session")
+            self.close()
+            return False
+        self.shellPID = int(result.stdout.strip())
+        self.logger.info(f"Started shell session (pid: {self.shellPID})")
+        return True
+
+    def close(self):
+        if self.channel is None:
+            return
+        self.channel.close()
+        self.channel = None
+        self.shellPID = None
+
+    def run(self, cmd: str, workDir: str, onOutput: Callable[[bytes], None] | None = None, epilogue: str = "") -> subprocess.CompletedProcess[str] | None:
+        if self.startsBackgroundJob(cmd) or not self.lock.acquire(blocking=False):
+            return None
+        try:
+            if not self.isAlive() and not self.start():
+                return None
+            try:
+                result = self.execute(cmd, workDir=workDir, timeout=self.timeout, onOutput=onOutput, epilogue=epilogue)
+                if not self.isAlive():
+                    self.logger.warning("Shell session exited")
+                    self.close()
+                return result
+            except TimeoutError:
+                self.logger.warning(f"Command timed out, restarting shell session: {cmd}")
+                self.killShell()
+                self.close()
+                return subprocess.CompletedProcess(cmd, 124, "", "")
+            except (OSError, DockerAPIError) as e:
+                self.logger.warning(f"Shell session died: {e}")
+                self.close()
+                return None
+        finally:
+            self.lock.release()
+
+    def execute(self, cmd: str, workDir: str, timeout: int, onOutput: Callable[[bytes], None] | None = None, epilogue: str = "") -> subprocess.CompletedProcess[str]:
+        # The epilogue runs after the markers, so it adds no latency to the
+        # command and must not write to stdout or stderr.
+        script = (
+            f"cd -- {shlex.quote(workDir)} && eval {shlex.quote(cmd)} < /dev/null\n"
+            f"__rc=$?; printf '%s %d\\n' {self.marker} $__rc; printf '%s\\n' {self.marker} >&2\n"
+            f"{epilogue}\n"
+        )
+        self.channel.write(script.encode())
+        stdout, stderr, returncode = self.readFrame(monotonic() + timeout, onOutput)
+        return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+
+    def readFrame(self, deadline: float, onOutput: Callable[[bytes], None] | None = None) -> tuple[str, str, int]:
+        buffers = {1: TailBuffer(self.maxOutputBytes), 2: TailBuffer(self.maxOutputBytes)}
+        scanners = {
+            1: MarkerScanner(self.stdoutPattern, self.marker.encode()),
+            2: MarkerScanner(self.stderrPattern, self.marker.encode())
+        }
+        def emit(stream: int, data: bytes):
+            if len(data) == 0:
+                return
+            if onOutput is not None:
+                onOutput(data)
+            else:
+                buffers[stream].write(data)
+        returncode = None
+        pending = {1, 2}
+        ended = False
+        while pending:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                if ended:
+                    break
+                raise TimeoutError()
+            for stream, chunk in self.channel.read(remaining):
+                if stream not in pending:
+                    continue
+                if not chunk:
+                    # The shell exited (e.g. `exit` or `set -e`); the other
+                    # stream may still hold output, so keep draining it.
+                    emit(stream, scanners[stream].flush())
+                    pending.discard(stream)
+                    ended = True
+                    continue
+                emit(stream, scanners[stream].feed(chunk))
+                if scanners[stream].matched:
+                    pending.discard(stream)
+                    if stream == 1:
+                        returncode = int(scanners[stream].groups[0])
+        if ended:
+            returncode = self.channel.wait()
+        return buffers[1].text(), buffers[2].text(), returncode
+
+    def killShell(self):
+        if self.shellPID is None:
+            return
+        try:
+            self.backend.execCommand(self.containerName, "/", f"pkill -KILL -P {self.shellPID}; kill -KILL {self.shellPID}", timeout=10)
+        except OSError as e:
+            self.logger.warning(f"Failed to kill shell session: {e}")
+
@@ -0,0 +1,16 @@
+import logging
+from time import perf_counter
+
+class StartupTimer:
+    def __init__(self, startedAt: float | None = None):
+        self.startedAt = startedAt if startedAt is not None else perf_counter()
+        self.last = self.startedAt
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def phase(self, name: str) -> float:
+        now = perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        self.logger.info(f"{name} in {elapsed * 1000:.0f} ms ({now - self.startedAt:.2f} s since start)")
+        return elapsed
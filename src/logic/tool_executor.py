@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import posixpath
+from typing import Any, Awaitable, Callable, Hashable
+
+from logic.command_cache import isReadOnly
+
+class Access:
+    # Resources are (kind, name) pairs; a name of None stands for every
+    # resource of that kind.
+    def __init__(self, reads: tuple[tuple[str, Hashable], ...] = (), writes: tuple[tuple[str, Hashable], ...] = ()):
+        self.reads = set(reads)
+        self.writes = set(writes)
+
+    @staticmethod
+    def overlaps(a: tuple[str, Hashable], b: tuple[str, Hashable]) -> bool:
+        return a[0] == b[0] and (a[1] is None or b[1] is None or a[1] == b[1])
+
+    def conflicts(self, other: "Access") -> bool:
+        return any(self.overlaps(write, resource) for write in self.writes for resource in other.reads | other.writes) \
+            or any(self.overlaps(write, resource) for write in other.writes for resource in self.reads)
+
+def fileResource(arguments: dict | None) -> tuple[str, Hashable]:
+    path = str((arguments or {}).get("path", ""))
+    return ("file", posixpath.normpath(path) if path.startswith("/") else None)
+
+PARALLEL_TOOLS: dict[str, Callable[[dict | None], Access | None]] = {
+    "exec_command": lambda arguments: Access(reads=(("file", None),)) if isReadOnly(str((arguments or {}).get("cmd", ""))) else None,
+    "read_output": lambda arguments: Access(),
+    "write_file": lambda arguments: Access(writes=(fileResource(arguments),)),
+    "open_port": lambda arguments: Access(writes=(("port", str((arguments or {}).get("port"))),))
+}
+
+class ToolCall:
+    def __init__(self, id: str, name: str, arguments: dict | None):
+        self.id = id
+        self.name = name
+        self.arguments = arguments
+
+class ToolExecutor:
+    def __init__(
+            self,
+            dispatch: Callable[[str, dict | None], Awaitable[Any]],
+            parallelTools: dict[str, Callable[[dict | None], Access | None]] = PARALLEL_TOOLS,
+            sequential: bool = False,
+            maxParallel: int = 4
+        ):
+        self.dispatch = dispatch
+        self.parallelTools = parallelTools
+        self.sequential = sequential
+        self.maxParallel = maxParallel
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def plan(self, calls: list[ToolCall]) -> list[list[ToolCall]]:
+        if self.sequential:
+            return [[call] for call in calls]
+        batches: list[list[ToolCall]] = []
+        batch: list[ToolCall] = []
+        accesses: list[Access] = []
+        for call in calls:
+            access = self.parallelTools[call.name](call.arguments) if call.name in self.parallelTools else None
+            if access is None:
+                if batch:
+                    batches.append(batch)
+                batches.append([call])
+                batch, accesses = [], []
+                continue
+            if len(batch) >= self.maxParallel or any(access.conflicts(other) for other in accesses):
+                batches.append(batch)
+                batch, accesses = [], []
+            batch.append(call)
+            accesses.append(access)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def execute(self, calls: list[ToolCall]) -> list[Any]:
+        results = []
+        for batch in self.plan(calls):
+            if len(batch) == 1:
+                results.append(await self.dispatch(batch[0].name, batch[0].arguments))
+                continue
+            self.logger.info(f"Running {len(batch)} tool calls in parallel: {', '.join(call.name for call in batch)}")
+            batchResults = await asyncio.gather(*[self.dispatch(call.name, call.arguments) for call in batch], return_exceptions=True)
+            for result in batchResults:
+                if isinstance(result, BaseException):
+                    raise result
+            results.extend(batchResults)
+        return results
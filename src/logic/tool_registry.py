@@ -0,0 +1,146 @@
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Literal, get_args, get_origin
+
+from logic.tracing import tracer
+from model.openai_tool import OpenAIFunction, OpenAIFunctionParameter, OpenAIFunctionParameterProperty, OpenAITool
+
+JSON_TYPES: dict[type, str] = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean"
+}
+
+class ToolError(Exception):
+    pass
+
+class ToolSpec:
+    def __init__(self, name: str, description: str, descriptions: dict[str, str]):
+        self.name = name
+        self.description = description
+        self.descriptions = descriptions
+
+def tool(description: str, /, **descriptions: str):
+    def decorator(func: Callable) -> Callable:
+        func.toolSpec = ToolSpec(func.__name__, description, descriptions)
+        return func
+    return decorator
+
+class ToolParameter:
+    def __init__(self, name: str, pythonType: type, enum: list[str] | None, required: bool, description: str | None):
+        self.name = name
+        self.pythonType = pythonType
+        self.enum = enum
+        self.required = required
+        self.description = description
+
+    def validate(self, value: Any):
+        if self.pythonType is float and isinstance(value, int) and not isinstance(value, bool):
+            return
+        if not isinstance(value, self.pythonType) or (self.pythonType is int and isinstance(value, bool)):
+            raise ToolError(f"Argument \"{self.name}\" must be {JSON_TYPES[self.pythonType]}")
+        if self.enum is not None and value not in self.enum:
+            raise ToolError(f"Argument \"{self.name}\" must be one of {', '.join(self.enum)}")
+
+class RegisteredTool:
+    def __init__(self, func: Callable, spec: ToolSpec):
+        self.func = func
+        self.spec = spec
+        self.isAsync = inspect.iscoroutinefunction(func)
+        self.parameters: dict[str, ToolParameter] = {}
+        for parameter in inspect.signature(func).parameters.values():
+            annotation = parameter.annotation if parameter.annotation is not inspect.Parameter.empty else str
+            enum = None
+            if get_origin(annotation) is Literal:
+                enum = list(get_args(annotation))
+                annotation = type(enum[0])
+            if annotation not in JSON_TYPES:
+                raise TypeError(f"Unsupported type for argument \"{parameter.name}\" of tool \"{spec.name}\": {annotation}")
+            self.parameters[parameter.name] = ToolParameter(
+                parameter.name,
+                annotation,
+                enum,
+                parameter.default is inspect.Parameter.empty,
+                spec.descriptions.get(parameter.name)
+            )
+
+    def schema(self) -> OpenAITool:
+        return OpenAITool(
+            function=OpenAIFunction(
+                name=self.spec.name,
+                description=self.spec.description,
+                parameters=OpenAIFunctionParameter(
+                    properties={
+                        parameter.name: OpenAIFunctionParameterProperty(
+                            type=JSON_TYPES[parameter.pythonType],
+                            description=parameter.description,
+                            enum=parameter.enum
+                        ) for parameter in self.parameters.values()
+                    },
+                    required=[parameter.name for parameter in self.parameters.values() if parameter.required]
+                )
+            )
+        )
+
+    def validate(self, arguments: dict | None):
+        if not isinstance(arguments, dict):
+            raise ToolError("Arguments must be a JSON object")
+        for key in arguments:
+            if key not in self.parameters:
+                raise ToolError(f"Unknown argument \"{key}\"")
+        for parameter in self.parameters.values():
+            if parameter.name in arguments:
+                parameter.validate(arguments[parameter.name])
+            elif parameter.required:
+                raise ToolError(f"Missing argument \"{parameter.name}\"")
+
+class ToolRegistry:
+    def __init__(self):
+        self.tools: dict[str, RegisteredTool] = {}
+        self.schemaCache: list[dict] | None = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    @classmethod
+    def fromInstance(cls, instance: object) -> "ToolRegistry":
+        registry = cls()
+        names = []
+        for klass in reversed(type(instance).__mro__):
+            for name, value in vars(klass).items():
+                if hasattr(value, "toolSpec") and name not in names:
+                    names.append(name)
+        for name in names:
+            registry.register(getattr(instance, name))
+        return registry
+
+    def register(self, func: Callable, spec: ToolSpec | None = None):
+        spec = spec or getattr(func, "toolSpec", None)
+        if spec is None:
+            raise TypeError(f"{func} is not decorated with @tool")
+        self.tools[spec.name] = RegisteredTool(func, spec)
+        self.schemaCache = None
+
+    def schema(self) -> list[dict]:
+        if self.schemaCache is None:
+            self.schemaCache = [registered.schema().dict(exclude_none=True) for registered in self.tools.values()]
+        return self.schemaCache
+
+    async def dispatch(self, name: str, arguments: dict | None) -> dict:
+        registered = self.tools.get(name)
+        try:
+            if registered is None:
+                raise ToolError(f"Unknown function \"{name}\"")
+            registered.validate(arguments)
+        except ToolError as e:
+            self.logger.warning(f"Rejected tool call {name}: {e}")
+            return {"result": "failed", "message": str(e)}
+        async with tracer.span("tool", name) as span:
+            if registered.isAsync:
+                result = await registered.func(**arguments)
+            else:
+                result = await asyncio.to_thread(registered.func, **arguments)
+            if isinstance(result, dict):
+                span.set(result=result.get("result"))
+            return result
@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import re
+import threading
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+from typing import Callable
+
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600)
+
+class NullSpan:
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    async def __aenter__(self) -> "NullSpan":
+        return self
+
+    async def __aexit__(self, *_):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Span(NullSpan):
+    def __init__(self, tracer: "Tracer", kind: str, name: str, attributes: dict):
+        self.tracer = tracer
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+        self.spanID = os.urandom(8).hex()
+        self.parent: Span | None = None
+        self.traceID = ""
+        self.startTime = 0.0
+        self.started = 0.0
+        self.token = None
+
+    def __enter__(self) -> "Span":
+        self.parent = currentSpan.get()
+        self.traceID = self.parent.traceID if self.parent is not None else os.urandom(16).hex()
+        self.startTime = time()
+        self.started = perf_counter()
+        self.token = currentSpan.set(self)
+        return self
+
+    def __exit__(self, excType, exc, _):
+        duration = perf_counter() - self.started
+        try:
+            currentSpan.reset(self.token)
+        except ValueError:
+            pass
+        self.tracer.finish(self, duration, exc)
+        return False
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, excType, exc, traceback):
+        return self.__exit__(excType, exc, traceback)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+currentSpan: ContextVar[Span | None] = ContextVar("currentSpan", default=None)
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class Tracer:
+    def __init__(self, prefix: str = "openailinux"):
+        self.prefix = prefix
+        self.enabled = False
+        self.durations: dict[tuple[str, str], Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.collectors: dict[str, Callable[[], dict[str, float]]] = {}
+        self.traceFile = None
+        self.server: ThreadingHTTPServer | None = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.level = logging.INFO
+
+    def configure(self, enabled: bool = True, tracePath: str | None = None, metricsPort: int | None = None):
+        self.enabled = enabled
+        if enabled and tracePath:
+            self.traceFile = open(tracePath, "a", buffering=1)
+        if enabled and metricsPort:
+            self.serve(metricsPort)
+
+    def span(self, kind: str, name: str = "", **attributes) -> NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, kind, name, attributes)
+
+    def count(self, metric: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def collect(self, prefix: str, collector: Callable[[], dict[str, float]]):
+        with self.lock:
+            self.collectors[prefix] = collector
+
+    def finish(self, span: Span, duration: float, error: BaseException | None):
+        key = (span.kind, span.name)
+        with self.lock:
+            if key not in self.durations:
+                self.durations[key] = Histogram(DURATION_BUCKETS)
+            self.durations[key].observe(duration)
+            if error is not None:
+                self.errors[key] = self.errors.get(key, 0) + 1
+            if self.traceFile is not None:
+                record = {
+                    "traceID": span.traceID,
+                    "spanID": span.spanID,
+                    "parentID": span.parent.spanID if span.parent is not None else None,
+                    "kind": span.kind,
+                    "name": span.name,
+                    "start": span.startTime,
+                    "duration": duration,
+                    "attributes": span.attributes
+                }
+                if error is not None:
+                    record["error"] = repr(error)
+                self.traceFile.write(json.dumps(record, default=str) + "\n")
+
+    @staticmethod
+    def formatLabels(labels: tuple | list) -> str:
+        if len(labels) == 0:
+            return ""
+        escaped = [(key, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for key, value in labels]
+        return "{" + ",".join(f"{key}=\"{value}\"" for key, value in escaped) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            name = f"{self.prefix}_span_duration_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for (kind, spanName), histogram in sorted(self.durations.items()):
+                labels = [("kind", kind), ("name", spanName)]
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{self.formatLabels(labels + [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{self.formatLabels(labels + [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{self.formatLabels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self.formatLabels(labels)} {histogram.count}")
+            name = f"{self.prefix}_span_errors_total"
+            lines.append(f"# TYPE {name} counter")
+            for (kind, spanName), count in sorted(self.errors.items()):
+                lines.append(f"{name}{self.formatLabels([('kind', kind), ('name', spanName)])} {count}")
+            metrics = sorted({metric for metric, _ in self.counters})
+            for metric in metrics:
+                name = f"{self.prefix}_{metric}"
+                lines.append(f"# TYPE {name} counter")
+                for (counterMetric, labels), value in sorted(self.counters.items()):
+                    if counterMetric == metric:
+                        lines.append(f"{name}{self.formatLabels(labels)} {value}")
+            collectors = sorted(self.collectors.items())
+        for prefix, collector in collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                self.logger.warning(f"Failed to collect {prefix} metrics: {e}")
+                continue
+            for metric, value in sorted(values.items()):
+                name = f"{self.prefix}_{prefix}_{re.sub(r'(?<!^)(?=[A-Z])', '_', metric).lower()}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0"):
+        tracer = self
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+        self.logger.info(f"Serving metrics on {host}:{port}/metrics")
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.traceFile is not None:
+            self.traceFile.close()
+            self.traceFile = None
+
+tracer = Tracer()
@@ -1,22 +1,127 @@
+from time import perf_counter
+startedAt = perf_counter()
+
 import os, logging
 
-from logic.discord_bot import DiscordBot
+from logic.docker_backend import parseSize
+from logic.startup_timer import StartupTimer
+from logic.tracing import tracer
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)-8s %(name)s: %(message)s")
+timer = StartupTimer(startedAt)
 
 logger = logging.getLogger("main.py")
 
 token = os.environ.get("DISCORD_TOKEN")
-userID = os.environ.get("DISCORD_USER_ID")
+userIDs = os.environ.get("DISCORD_USER_ID")
 openAIToken = os.environ.get("OPENAI_API_KEY")
+dockerBackend = os.environ.get("DOCKER_BACKEND", "cli")
+poolSize = os.environ.get("POOL_SIZE", "1")
+sandboxImage = os.environ.get("SANDBOX_IMAGE", "openai-sandbox")
+containerCPU = os.environ.get("CONTAINER_CPU", "1.0")
+containerRAM = os.environ.get("CONTAINER_RAM", "512mb")
+containerSwap = os.environ.get("CONTAINER_SWAP", "512mb")
+maxSessions = os.environ.get("MAX_SESSIONS", "4")
+maxConcurrency = os.environ.get("MAX_CONCURRENCY", "2")
+jobsPath = os.environ.get("JOBS_DB", "jobs.db")
+checkpointBudget = os.environ.get("CHECKPOINT_BUDGET", "2gb")
+resourceInterval = os.environ.get("RESOURCE_INTERVAL", "10")
+maxContainerCPU = os.environ.get("MAX_CONTAINER_CPU", "")
+maxContainerRAM = os.environ.get("MAX_CONTAINER_RAM", "")
+admissionTimeout = os.environ.get("ADMISSION_TIMEOUT", "300")
+idleTimeout = os.environ.get("SESSION_IDLE_TIMEOUT", "0")
+sequentialTools = os.environ.get("SEQUENTIAL_TOOLS", "false").lower() in ("1", "true", "yes")
+commandCache = os.environ.get("COMMAND_CACHE", "false").lower() in ("1", "true", "yes")
+tracing = os.environ.get("TRACING", "false").lower() in ("1", "true", "yes")
+tracePath = os.environ.get("TRACE_PATH", "")
+metricsPort = os.environ.get("METRICS_PORT", "")
 if token is None or token == "":
     logger.error("Please Set DISCORD_TOKEN")
     exit(1)
 if openAIToken is None or openAIToken == "":
     logger.error("Please Set OPENAI_API_KEY")
     exit(1)
-if userID is None or userID == "":
+if userIDs is None or userIDs == "":
     logger.error("Please Set DISCORD_USER_ID")
     exit(1)
+if not all(userID.strip().isdigit() for userID in userIDs.split(",")):
+    logger.error("DISCORD_USER_ID must be a comma-separated list of user IDs")
+    exit(1)
+if dockerBackend not in ("cli", "api"):
+    logger.error("DOCKER_BACKEND must be \"cli\" or \"api\"")
+    exit(1)
+if not poolSize.isdigit():
+    logger.error("POOL_SIZE must be a non-negative integer")
+    exit(1)
+if not maxSessions.isdigit() or int(maxSessions) < 1:
+    logger.error("MAX_SESSIONS must be a positive integer")
+    exit(1)
+if not maxConcurrency.isdigit() or int(maxConcurrency) < 1:
+    logger.error("MAX_CONCURRENCY must be a positive integer")
+    exit(1)
+if metricsPort != "" and not metricsPort.isdigit():
+    logger.error("METRICS_PORT must be a port number")
+    exit(1)
+try:
+    containerCPU = float(containerCPU)
+except ValueError:
+    logger.error("CONTAINER_CPU must be a number")
+    exit(1)
+try:
+    checkpointBudget = parseSize(checkpointBudget)
+except (ValueError, IndexError):
+    logger.error("CHECKPOINT_BUDGET must be a size such as 2gb, or 0 to disable checkpoints")
+    exit(1)
+try:
+    resourceInterval = float(resourceInterval)
+    admissionTimeout = float(admissionTimeout)
+    idleTimeout = float(idleTimeout)
+except ValueError:
+    logger.error("RESOURCE_INTERVAL, ADMISSION_TIMEOUT and SESSION_IDLE_TIMEOUT must be numbers of seconds")
+    exit(1)
+try:
+    maxContainerCPU = float(maxContainerCPU) if maxContainerCPU != "" else None
+except ValueError:
+    logger.error("MAX_CONTAINER_CPU must be a number")
+    exit(1)
+try:
+    if maxContainerRAM != "":
+        parseSize(maxContainerRAM)
+except (ValueError, IndexError):
+    logger.error("MAX_CONTAINER_RAM must be a size such as 2gb")
+    exit(1)
+
+timer.phase("Validated configuration")
 
 if __name__ == "__main__":
-    bot = DiscordBot(token=token, userID=int(userID), openAIToken=openAIToken)
-    bot.run()
\ No newline at end of file
+    from logic.discord_bot import DiscordBot
+    timer.phase("Loaded modules")
+    tracer.configure(enabled=tracing, tracePath=tracePath or None, metricsPort=int(metricsPort) if metricsPort != "" else None)
+    bot = DiscordBot(
+        token=token,
+        userIDs=[int(userID) for userID in userIDs.split(",")],
+        openAIToken=openAIToken,
+        dockerBackend=dockerBackend,
+        poolSize=int(poolSize),
+        sandboxImage=sandboxImage,
+        cpu=containerCPU,
+        ram=containerRAM,
+        swap=containerSwap,
+        maxSessions=int(maxSessions),
+        maxConcurrency=int(maxConcurrency),
+        sequentialTools=sequentialTools,
+        commandCache=commandCache,
+        jobsPath=jobsPath,
+        checkpointBudget=checkpointBudget,
+        resourceInterval=resourceInterval,
+        maxCPU=maxContainerCPU,
+        maxRAM=maxContainerRAM or None,
+        admissionTimeout=admissionTimeout,
+        idleTimeout=idleTimeout if idleTimeout > 0 else None,
+        startupTimer=timer
+    )
+    timer.phase("Initialized bot")
+    try:
+        bot.run()
+    finally:
+        tracer.close()
\ No newline at end of file
@@ -2,4 +2,7 @@ from pydantic import BaseModel
 
 class RunResult(BaseModel):
     returncode: int
-    output: str
\ No newline at end of file
+    output: str
+    log_id: int | None = None
+    total_bytes: int | None = None
+    message: str | None = None
\ No newline at end of file